@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import time
+import numpy as np
+import sparse_transitions
+
+class BeamViterbi(object):
+    """Beam-pruned Viterbi decoding against a compiled HiddenMarkovModel
+
+    After every step only the beam_width best states, and/or the states within
+    beam_threshold (in log probability) of the best one, stay active. Each
+    step keeps a compact list of its active states and their backpointers in
+    place of full score and backtrack columns. Scores are always kept in log
+    space; with the beam wide enough to keep every state the result matches
+    exact decoding of a log probability model.
+    """
+
+    def __init__(self, model, beam_width=None, beam_threshold=None):
+        """ Intialize Local Variables """
+
+        if beam_width is not None and beam_width < 1:
+            raise ValueError("beam_width must be at least 1")
+
+        if beam_threshold is not None and beam_threshold < 0:
+            raise ValueError("beam_threshold must not be negative")
+
+        self._model = model
+        self._beam_width = beam_width
+        self._beam_threshold = beam_threshold
+
+        # Log space parameters
+        transitions = model._transition_matrix_a
+        with np.errstate(divide="ignore"):
+            if model.use_log_probabilities:
+                self._transition_matrix_a = transitions
+                self._emission_rows = model._emission_rows
+                self._initial_state_array_i = model._initial_state_array_i
+            else:
+                if isinstance(transitions, sparse_transitions.SparseTransitions):
+                    self._transition_matrix_a = sparse_transitions.SparseTransitions(
+                        transitions.shape[0], transitions._sources, transitions._destinations,
+                        np.log(transitions._values), fill=-np.inf)
+                else:
+                    self._transition_matrix_a = np.log(transitions)
+                self._emission_rows = np.log(model._emission_rows)
+                self._initial_state_array_i = np.log(model._initial_state_array_i)
+
+        self.mean_active_states = 0.0
+        return
+
+    def decode(self, observations):
+        """Finds the beam-pruned Viterbi path of one observation sequence
+
+        Returns:
+            path (list): The most likely state sequence found
+            probability (float): Its log probability
+
+        """
+        path, probability = self.decode_indices(self._model.encode(observations))
+        return self._model.to_state_space(path), probability
+
+    def decode_indices(self, observed):
+        """Beam-pruned Viterbi path of an index coded sequence as state indices"""
+        return self._decode(observed, self._transition_matrix_a, self._beam_width, self._beam_threshold)
+
+    def _decode(self, observed, transitions, beam_width, beam_threshold):
+        """ Viterbi recursion over compact active state lists """
+        num_observations = len(observed)
+
+        # Compact per step lists: active states and the previous state of each
+        active_states = [None] * num_observations
+        backpointers = [None] * num_observations
+
+        # Reduced precision scores are kept near zero, the offset holds the rest
+        offset = 0.0
+        rescale = self._model._rescale
+
+        column = self._initial_state_array_i + self._emission_rows[observed[0]]
+        active_states[0], scores = _prune(column, beam_width, beam_threshold)
+        total_active = len(active_states[0])
+
+        for i in range(1, num_observations):
+            column, best = _expand(transitions, active_states[i-1], scores)
+            column = column + self._emission_rows[observed[i]]
+
+            active_states[i], scores = _prune(column, beam_width, beam_threshold)
+            backpointers[i] = best[active_states[i]]
+            total_active += len(active_states[i])
+
+            if rescale and scores.max() > -np.inf:
+                peak = scores.max()
+                scores = scores - peak
+                offset += float(peak)
+
+        self.mean_active_states = total_active / num_observations
+
+        # Backtrack through the active lists
+        path = np.zeros(num_observations, dtype=int)
+        best_position = int(np.argmax(scores))
+        probability = float(scores[best_position]) + offset if rescale else scores[best_position]
+        path[-1] = active_states[-1][best_position]
+
+        for i in range(num_observations - 1, 0, -1):
+            position = np.searchsorted(active_states[i], path[i])
+            path[i-1] = backpointers[i][position]
+
+        return path, probability
+
+    def compare_with_exact(self, sequences):
+        """Reports how often pruning changed the result compared with exact decoding
+
+        Returns:
+            report (dict): Changed paths and steps, log probability lost, active
+                           states per step and the time of both decoders
+
+        """
+        changed_paths = 0
+        changed_steps = 0
+        total_steps = 0
+        probability_loss = 0.0
+        active = 0.0
+        exact_seconds = 0.0
+        beam_seconds = 0.0
+
+        for sequence in sequences:
+            observed = self._model.encode(sequence)
+
+            start = time.perf_counter()
+            # Exact decoding in the same log domain as the beam, sparse models stay sparse
+            exact_path, exact_probability = self._decode(observed, self._transition_matrix_a, None, None)
+            exact_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            beam_path, beam_probability = self.decode_indices(observed)
+            beam_seconds += time.perf_counter() - start
+
+            mismatched = np.count_nonzero(exact_path != beam_path)
+            changed_paths += mismatched > 0
+            changed_steps += mismatched
+            total_steps += len(observed)
+            probability_loss += exact_probability - beam_probability
+            active += self.mean_active_states * len(observed)
+
+        num_sequences = max(len(sequences), 1)
+        return {"sequences": len(sequences),
+                "changed_paths": int(changed_paths),
+                "changed_path_fraction": float(changed_paths / num_sequences),
+                "changed_step_fraction": float(changed_steps / max(total_steps, 1)),
+                "mean_log_probability_loss": float(probability_loss / num_sequences),
+                "mean_active_states": float(active / max(total_steps, 1)),
+                "exact_seconds": exact_seconds,
+                "beam_seconds": beam_seconds}
+
+def _expand(transitions, states, scores):
+    """Best score and previous state of every state reachable from the active ones"""
+    num_states = transitions.shape[0]
+
+    if not isinstance(transitions, sparse_transitions.SparseTransitions):
+        # (active x N) block of the transition matrix, ties go to the lowest state
+        product = scores[:, None] + transitions[states]
+        position = product.argmax(axis=0)
+        return product[position, np.arange(num_states)], states[position]
+
+    positions, destinations, values = transitions.outgoing(states)
+    candidates = scores[positions] + values
+    sources = states[positions]
+
+    # Per destination keep the highest score, ties to the lowest source
+    order = np.lexsort((sources, -candidates, destinations))
+    first = np.r_[True, destinations[order][1:] != destinations[order][:-1]]
+    winners = order[first]
+
+    column = np.full(num_states, -np.inf)
+    best = np.zeros(num_states, dtype=np.intp)
+    column[destinations[winners]] = candidates[winners]
+    best[destinations[winners]] = sources[winners]
+    return column, best
+
+def _prune(column, beam_width, beam_threshold):
+    """Active states (sorted) and their scores after applying the beam"""
+    keep = np.flatnonzero(column > -np.inf)
+    if len(keep) == 0:
+        keep = np.arange(len(column))
+
+    if beam_threshold is not None:
+        best = column[keep].max()
+        keep = keep[column[keep] >= best - beam_threshold]
+
+    if beam_width is not None and len(keep) > beam_width:
+        top = np.argpartition(-column[keep], beam_width - 1)[:beam_width]
+        keep = np.sort(keep[top])
+
+    return keep, column[keep]
+
+if __name__ == "__main__":
+    print(__file__)
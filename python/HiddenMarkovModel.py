@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import threading
+import numpy as np
+import viterbi_engine
+import batch_viterbi
+import observation_encoding
+import sparse_transitions
+from decode_stats import phase
+
+class HiddenMarkovModel(object):
+    """A compiled Hidden Markov Model that decodes any number of observation sequences
+
+    The decoding domain matrices, the observation lookup and the scratch
+    buffers are built once and reused by every call to decode.
+
+    Scratch buffers and peak_memory_bytes are kept per thread, so one model
+    can decode from several threads at once. Decoders that hold their own
+    sequence state (StreamingViterbi, IncrementalViterbi) are not thread safe.
+    """
+
+    def __init__(self, transition_matrix_a, emission_matrix_b, initial_state_array_i, state_space=None, observation_space=None, use_log_probabilities=False, dtype=np.float64, log_space_input=False, stats=None):
+        """ Intialize Local Variables
+
+        transition_matrix_a may be a SparseTransitions for large banded or
+        left-to-right models, every step then costs O(nonzero transitions).
+
+        dtype (np.float32 or np.float64) is carried through the matrices, the
+        emission gather and the recursion. Below float64 every score column is
+        rescaled to a max of one (zero in log space) and the factors are kept
+        in float64, so precision does not degrade with sequence length.
+
+        log_space_input marks the three arrays as already holding log
+        probabilities, which skips the eps and log step (log mode only).
+
+        stats is an optional DecodeStats, when given every phase of the
+        construction and of each decode is timed and counted on it.
+        """
+
+        if log_space_input and not use_log_probabilities:
+            raise ValueError("log_space_input requires use_log_probabilities")
+
+        self._dtype = np.dtype(dtype)
+        self._rescale = self._dtype != np.float64
+        self.stats = stats
+
+        # Save Inputs
+        self._state_space = state_space
+
+        if observation_space is None:
+            self._observation_space = [i for i in range(len(emission_matrix_b[0]))]
+        else:
+            self._observation_space = observation_space
+
+        # Setup Index Lookup for Observations
+        self._encoder = observation_encoding.ObservationEncoder(observation_space)
+        self._obs_to_index = self._encoder._obs_to_index if observation_space is not None else None
+
+        self._use_log_probabilities = use_log_probabilities
+        self._sparse = isinstance(transition_matrix_a, sparse_transitions.SparseTransitions)
+        self._transition_matrix_a = transition_matrix_a if self._sparse else np.array(transition_matrix_a, dtype=float)
+        self._emission_matrix_b = np.array(emission_matrix_b, dtype=float)
+        self._initial_state_array_i = np.array(initial_state_array_i, dtype=float)
+
+        with phase(stats, "log_conversion"):
+            self._convert(log_space_input)
+
+        # Retrieve Sizes
+        self._num_states = self._transition_matrix_a.shape[0]
+
+        # One contiguous row per observation for the emission gather
+        self._emission_rows = np.ascontiguousarray(self._emission_matrix_b.T)
+
+        # Scratch Buffers, one set per thread, grown on demand and reused across decodes
+        self._local = threading.local()
+        return
+
+    def __getstate__(self):
+        # Scratch buffers are rebuilt on first use, thread locals cannot be pickled
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _thread_scratch(self):
+        """Scratch buffers of the calling thread, created on first use"""
+        local = self._local
+        if not hasattr(local, "product"):
+            local.product = np.empty((0, 0) if self._sparse else (self._num_states, self._num_states), dtype=self._dtype)
+            local.scores = np.empty((0, self._num_states), dtype=self._dtype)
+            local.backtrack = np.empty((0, self._num_states), dtype=int)
+            local.peak_memory_bytes = 0
+        return local
+
+    @property
+    def _product(self):
+        return self._thread_scratch().product
+
+    @property
+    def peak_memory_bytes(self):
+        """Estimated working bytes of the last decode run by the calling thread"""
+        return self._thread_scratch().peak_memory_bytes
+
+    @property
+    def num_states(self):
+        return self._num_states
+
+    @property
+    def use_log_probabilities(self):
+        return self._use_log_probabilities
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    def encode(self, observations):
+        """Replaces observations with their index in the observation space
+
+        Integer ndarrays that are already index coded are returned without a copy.
+        """
+        with phase(self.stats, "encode"):
+            return self._encoder.encode(observations)
+
+    def to_state_space(self, path):
+        """Converts a path of state indices to the state space, if one was provided"""
+        if self._state_space is not None:
+            with phase(self.stats, "labels"):
+                return [self._state_space[path[i]] for i in range(len(path))]
+        return path
+
+    def decode(self, observations, memory_mode="full"):
+        """Finds the Viterbi path of one observation sequence
+
+        Args:
+            observations (list): Observations, in the observation space when one was provided
+            memory_mode (str): "full", "low" or "checkpoint", see ViterbiAlgorithm
+
+        Returns:
+            path (list): The most likely state sequence
+            probability (float): The probability of that sequence
+
+        """
+        path, probability = self.decode_indices(self.encode(observations), memory_mode=memory_mode)
+        return self.to_state_space(path), probability
+
+    def decode_indices(self, observed, memory_mode="full", scores=None, backtrack=None):
+        """Finds the Viterbi path of an index coded sequence as state indices
+
+        In full mode the score and backtrack matrices can be supplied by the
+        caller, otherwise the model's scratch buffers are used.
+        """
+        if memory_mode not in ("full", "low", "checkpoint"):
+            raise ValueError("Unknown memory_mode: " + str(memory_mode))
+
+        if self.stats is not None:
+            self.stats.count("sequences")
+            self.stats.count("steps", len(observed))
+            self.stats.count("state_steps", len(observed) * self._num_states)
+
+        if memory_mode == "full":
+            return self._run_full(observed, scores, backtrack)
+        return self._run_low_memory(observed, memory_mode)
+
+    def dense_transition_matrix(self):
+        """Transition matrix in the decoding domain as a dense array"""
+        if self._sparse:
+            return self._transition_matrix_a.to_dense()
+        return self._transition_matrix_a
+
+    def decode_batch(self, sequences):
+        """Decodes many sequences together, see batch_viterbi.batch_decode
+
+        Sparse models decode one sequence at a time with the sparse engine,
+        the batched (batch x N x N) broadcast would densify them.
+        """
+        if self._sparse:
+            encoded = [self.encode(sequence) for sequence in sequences]
+            if any(len(observed) == 0 for observed in encoded):
+                raise ValueError("Cannot decode an empty observation sequence")
+
+            results = [self.decode_indices(observed) for observed in encoded]
+            return ([self.to_state_space(path) for path, _ in results],
+                    np.array([probability for _, probability in results], dtype=float))
+
+        paths, probabilities = batch_viterbi.decode_encoded_batch(self.dense_transition_matrix(), self._emission_matrix_b,
+                                                                  self._initial_state_array_i,
+                                                                  [self.encode(sequence) for sequence in sequences],
+                                                                  self._use_log_probabilities,
+                                                                  rescale=self._rescale)
+        return [self.to_state_space(path) for path in paths], probabilities
+
+    def first_column(self, observation):
+        """Accumulated probability of a sequence starting with observation"""
+        if (self._use_log_probabilities):
+            return self._initial_state_array_i + self._emission_rows[observation]
+        return self._initial_state_array_i * self._emission_rows[observation]
+
+    def _convert(self, log_space_input):
+        """Takes the log of the matrices if needed and casts them to the model dtype"""
+
+        # If using log probabilities, initialize matrices with small deltas to protect against zero
+        if (self._use_log_probabilities and not log_space_input):
+            if self._sparse:
+                self._transition_matrix_a = self._transition_matrix_a.log()
+            else:
+                self._transition_matrix_a = np.log(self._transition_matrix_a + np.finfo(float).eps)
+            self._emission_matrix_b = np.log(self._emission_matrix_b + np.finfo(float).eps)
+            self._initial_state_array_i = np.log(self._initial_state_array_i + np.finfo(float).eps)
+
+        # Convert to the working precision, after the log so rounding happens once
+        if self._sparse:
+            self._transition_matrix_a = self._transition_matrix_a.astype(self._dtype,
+                                                                         fill=-np.inf if log_space_input else None)
+        else:
+            self._transition_matrix_a = self._transition_matrix_a.astype(self._dtype, copy=False)
+        self._emission_matrix_b = self._emission_matrix_b.astype(self._dtype, copy=False)
+        self._initial_state_array_i = self._initial_state_array_i.astype(self._dtype, copy=False)
+
+    def _new_scale(self):
+        """Accumulator for rescaled columns, None at full precision"""
+        return np.zeros(1) if self._rescale else None
+
+    def _probability(self, value, scale):
+        """Undoes the rescaling of a final score"""
+        if scale is None:
+            return value
+        if (self._use_log_probabilities):
+            return float(value) + scale[0]
+        return float(value) * np.exp(scale[0])
+
+    def _record_memory(self, *parts):
+        """Sets peak_memory_bytes to the bytes of the working arrays alive together
+
+        Each part is an array, or the (shape, dtype) of a temporary allocated
+        inside viterbi_engine. The figure is an estimate from shapes, nothing
+        is allocated to compute it.
+        """
+        self._thread_scratch().peak_memory_bytes = sum(_nbytes(part) for part in parts)
+        if self.stats is not None:
+            self.stats.record_bytes(self.peak_memory_bytes)
+
+    def _scratch(self, num_observations):
+        """Returns score and backtrack buffers of at least num_observations rows"""
+        local = self._thread_scratch()
+        if len(local.scores) < num_observations:
+            local.scores = np.empty((num_observations, self._num_states), dtype=self._dtype)
+            local.backtrack = np.empty((num_observations, self._num_states), dtype=int)
+        return local.scores[:num_observations], local.backtrack[:num_observations-1]
+
+    def _run_full(self, observed, scores=None, backtrack=None):
+        """ Keeps every score column and backpointer """
+        num_observations = len(observed)
+
+        if scores is None or backtrack is None:
+            scores, backtrack = self._scratch(num_observations)
+
+        with phase(self.stats, "forward"):
+            # Gather the emission column of every observation once, one row per step
+            emission_columns = self._emission_rows[observed]
+
+            # Compute Accumulated Probability and Backtrack Matrices
+            scale = self._new_scale()
+            scores[0] = self.first_column(observed[0])
+            if scale is not None:
+                viterbi_engine.rescale(scores[0], self._use_log_probabilities, scale)
+
+            viterbi_engine.forward_pass(self._transition_matrix_a, emission_columns[1:], scores[0],
+                                        self._use_log_probabilities,
+                                        backtrack=backtrack,
+                                        scores=scores[1:],
+                                        product=self._product,
+                                        scale=scale)
+
+        with phase(self.stats, "backtrack"):
+            # Set last entry to most likely state
+            last_state = np.argmax(scores[-1])
+
+            # Starting from the end to backtrack viterbi path
+            path = viterbi_engine.backtrack_path(backtrack, last_state)
+
+        self._record_memory(emission_columns, scores, backtrack, self._product, path)
+        return path, self._probability(scores[-1][last_state], scale)
+
+    def _run_low_memory(self, observed, memory_mode):
+        """ Keeps only a rolling score column, plus backpointers or checkpoints """
+        num_steps = len(observed) - 1
+        dtype = viterbi_engine.backtrack_dtype(self._num_states)
+        column = self.first_column(observed[0])
+        path = np.zeros(len(observed), dtype=int)
+
+        scale = self._new_scale()
+        if scale is not None:
+            viterbi_engine.rescale(column, self._use_log_probabilities, scale)
+
+        if memory_mode == "checkpoint":
+            interval = max(int(np.ceil(np.sqrt(num_steps))), 1)
+            backtrack = None
+            checkpoints = np.empty((-(-num_steps // interval), self._num_states), dtype=self._dtype)
+        else:
+            interval = viterbi_engine.BLOCK_SIZE
+            backtrack = np.empty((num_steps, self._num_states), dtype=dtype)
+            checkpoints = None
+
+        with phase(self.stats, "forward"):
+            column = viterbi_engine.blocked_forward_pass(self._transition_matrix_a, self._emission_rows,
+                                                         observed, column,
+                                                         self._use_log_probabilities, interval,
+                                                         backtrack=backtrack,
+                                                         checkpoints=checkpoints,
+                                                         product=self._product,
+                                                         scale=scale)
+
+        # Set last entry to most likely state
+        last_state = np.argmax(column)
+
+        with phase(self.stats, "backtrack"):
+            if memory_mode == "checkpoint":
+                path = viterbi_engine.checkpointed_backtrack(self._transition_matrix_a, self._emission_rows,
+                                                             observed, checkpoints,
+                                                             interval, last_state,
+                                                             self._use_log_probabilities,
+                                                             path=path,
+                                                             product=self._product,
+                                                             scale=scale)
+            else:
+                path = viterbi_engine.backtrack_path(backtrack, last_state, path=path)
+
+        # The engine gathers one block of emission columns at a time and, when checkpointing, one segment of backpointers
+        block = ((min(interval, num_steps), self._num_states), self._dtype)
+        if memory_mode == "checkpoint":
+            self._record_memory(checkpoints, ((min(interval, num_steps), self._num_states), dtype), block,
+                                self._product, column, path)
+        else:
+            self._record_memory(backtrack, block, self._product, column, path)
+
+        return path, self._probability(column[last_state], scale)
+
+def _nbytes(part):
+    """Bytes of an array, or of an array of the given (shape, dtype)"""
+    if isinstance(part, np.ndarray):
+        return part.nbytes
+    shape, dtype = part
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+if __name__ == "__main__":
+    print(__file__)
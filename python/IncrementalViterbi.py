@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import viterbi_engine
+
+# Steps between saved score columns
+CHECKPOINT_INTERVAL = 256
+
+class IncrementalViterbi(object):
+    """A Viterbi decoder for a sequence that grows by appends and is corrected near the tail
+
+    Every backpointer row is kept, plus the score column every
+    checkpoint_interval steps and the column of the last step. Appending
+    only runs the recursion over the new observations. Editing position k
+    restarts the recursion from the last checkpoint before k, so the cost is
+    at most checkpoint_interval steps more than the length of the changed tail.
+    The backtrack stops as soon as it rejoins the previous path before the
+    first changed step. Results are identical to a full decode of the sequence.
+    """
+
+    def __init__(self, model, observations=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        """ Intialize Local Variables
+
+        Args:
+            model (HiddenMarkovModel): Compiled model
+            observations (list): Optional initial observations
+            checkpoint_interval (int): Steps between saved score columns
+
+        """
+        if checkpoint_interval < 1:
+            raise ValueError("checkpoint_interval must be at least 1")
+
+        self._model = model
+        self._interval = checkpoint_interval
+        self._num_states = model.num_states
+        self._use_log_probabilities = model.use_log_probabilities
+
+        # Growable storage, the first self._length entries are valid
+        self._length = 0
+        self._observed = np.zeros(0, dtype=np.intp)
+        self._backtrack = np.zeros((0, self._num_states), dtype=viterbi_engine.backtrack_dtype(self._num_states))
+        self._checkpoints = np.zeros((0, self._num_states), dtype=model.dtype)
+        self._checkpoint_scales = np.zeros(0)
+
+        # Score column (and rescaling offset) of the last step
+        self._column = None
+        self._scale = None
+
+        # Path of the last decode, and how many leading backtrack rows it still agrees with
+        self._path = np.zeros(0, dtype=int)
+        self._path_length = 0
+        self._stable_rows = 0
+
+        if observations is not None:
+            self.append(observations)
+        return
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def observations(self):
+        """Index coded observations decoded so far"""
+        return self._observed[:self._length]
+
+    def append(self, observations):
+        """Adds observations to the end, running the recursion over them only"""
+        observed = self._model.encode(observations)
+        if len(observed) == 0:
+            return
+
+        start = self._length
+        self._resize(start + len(observed))
+        self._observed[start:self._length] = observed
+
+        if start == 0:
+            self._restart(0)
+        else:
+            self._stable_rows = min(self._stable_rows, start - 1)
+            self._advance(start - 1, self._column, self._scale)
+
+    def edit(self, position, observations):
+        """Replaces the observations from position on, extending the sequence if they run past its end"""
+        observed = self._model.encode(observations)
+        if position < 0 or position > self._length:
+            raise IndexError("Edit position out of range: " + str(position))
+        if len(observed) == 0:
+            return
+
+        self._resize(max(self._length, position + len(observed)))
+        self._observed[position:position + len(observed)] = observed
+        self._restart(position)
+
+    def truncate(self, length):
+        """Drops every observation from length on"""
+        if length < 0 or length > self._length:
+            raise IndexError("Truncate length out of range: " + str(length))
+        if length == self._length:
+            return
+
+        self._length = length
+        if length == 0:
+            self._column = None
+            self._scale = None
+            self._path_length = 0
+            self._stable_rows = 0
+            return
+
+        self._restart(length)
+
+    def decode(self):
+        """Viterbi path of the current sequence, in the state space
+
+        Returns:
+            path (list): The most likely state sequence
+            probability (float): The probability of that sequence
+
+        """
+        path, probability = self.decode_indices()
+        return self._model.to_state_space(path), probability
+
+    def decode_indices(self):
+        """Viterbi path of the current sequence as state indices"""
+        if self._length == 0:
+            raise ValueError("Cannot decode an empty observation sequence")
+
+        if len(self._path) < self._length:
+            path = np.zeros(len(self._observed), dtype=int)
+            path[:self._path_length] = self._path[:self._path_length]
+            self._path = path
+
+        # Set last entry to most likely state
+        last_state = int(np.argmax(self._column))
+        state = last_state
+        self._path[self._length - 1] = state
+
+        # Backtrack until the path rejoins the previous one where the backpointers are unchanged
+        for i in range(self._length - 2, -1, -1):
+            state = int(self._backtrack[i, state])
+            if i <= self._stable_rows and i < self._path_length and self._path[i] == state:
+                break
+            self._path[i] = state
+
+        self._path_length = self._length
+        self._stable_rows = self._length - 1
+
+        return self._path[:self._length].copy(), self._model._probability(self._column[last_state], self._scale)
+
+    def _restart(self, position):
+        """ Reruns the recursion from the last checkpoint before position """
+        if position == 0:
+            scale = self._model._new_scale()
+            column = self._model.first_column(self._observed[0])
+            if scale is not None:
+                viterbi_engine.rescale(column, self._use_log_probabilities, scale)
+
+            self._store_checkpoint(0, column, scale)
+            self._stable_rows = 0
+            self._advance(0, column, scale)
+            return
+
+        c = (position - 1) // self._interval
+        step = c * self._interval
+        column = self._checkpoints[c].copy()
+        scale = None if self._scale is None else np.array([self._checkpoint_scales[c]])
+
+        self._stable_rows = min(self._stable_rows, step)
+        self._advance(step, column, scale)
+
+    def _advance(self, step, column, scale):
+        """ Runs the recursion from the known column of step to the last step, saving checkpoints on the way """
+        model = self._model
+        while step < self._length - 1:
+            stop = min((step // self._interval + 1) * self._interval, self._length - 1)
+
+            column = viterbi_engine.forward_pass(model._transition_matrix_a,
+                                                 model._emission_rows[self._observed[step+1:stop+1]], column,
+                                                 self._use_log_probabilities,
+                                                 backtrack=self._backtrack[step:stop],
+                                                 product=model._product,
+                                                 scale=scale)
+            step = stop
+
+            if step % self._interval == 0:
+                self._store_checkpoint(step // self._interval, column, scale)
+
+        self._column = column
+        self._scale = scale
+
+    def _store_checkpoint(self, c, column, scale):
+        self._checkpoints[c] = column
+        self._checkpoint_scales[c] = 0.0 if scale is None else scale[0]
+
+    def _resize(self, length):
+        """ Sets the length, growing the storage geometrically """
+        if length > len(self._observed):
+            capacity = max(length, 2 * len(self._observed), 16)
+            num_checkpoints = (capacity - 1) // self._interval + 1
+
+            self._observed = _grow(self._observed, capacity)
+            self._backtrack = _grow(self._backtrack, capacity - 1)
+            self._checkpoints = _grow(self._checkpoints, num_checkpoints)
+            self._checkpoint_scales = _grow(self._checkpoint_scales, num_checkpoints)
+
+        self._length = length
+
+def _grow(array, rows):
+    """Copy of array with room for rows leading entries"""
+    grown = np.zeros((rows,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+if __name__ == "__main__":
+    print(__file__)
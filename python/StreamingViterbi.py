@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from collections import deque
+import numpy as np
+import viterbi_engine
+import HiddenMarkovModel
+
+class StreamingViterbi(object):
+    """A Viterbi decoder that consumes observations one at a time
+
+    States are emitted as soon as every surviving path agrees on them (path
+    convergence), or once they are more than max_lag steps old. Only the
+    backtrack rows of undecided steps are kept, so memory is bounded by the
+    lag window rather than by the length of the stream.
+    """
+
+    def __init__(self, transition_matrix_a, emission_matrix_b, initial_state_array_i, state_space=None, observation_space=None, use_log_probabilities=False, max_lag=None):
+        """ Intialize Local Variables """
+
+        # Save Inputs
+        self._state_space = state_space
+        self._use_log_probabilities = use_log_probabilities
+        self._max_lag = max_lag
+
+        if max_lag is not None and max_lag < 1:
+            raise ValueError("max_lag must be at least 1")
+
+        # Compile the model once for the whole stream
+        self._model = HiddenMarkovModel.HiddenMarkovModel(transition_matrix_a, emission_matrix_b, initial_state_array_i,
+                                                          observation_space=observation_space,
+                                                          use_log_probabilities=use_log_probabilities)
+        self._obs_to_index = self._model._obs_to_index
+        self._transition_matrix_a = self._model._transition_matrix_a
+        self._num_states = self._model.num_states
+        self._emission_rows = self._model._emission_rows
+        self._product = self._model._product
+        self._backtrack_dtype = viterbi_engine.backtrack_dtype(self._num_states)
+
+        # Decoder State
+        self._column = None
+        self._log_scale = 0.0
+        self._window = deque()
+        self.num_observations = 0
+        self.num_finalized = 0
+        self.viterbi_probability = 0
+        return
+
+    def push(self, observation):
+        """Adds one observation and returns the states finalized by it"""
+
+        if self._obs_to_index is not None:
+            observation = self._obs_to_index[observation]
+
+        emission = self._emission_rows[observation]
+
+        if self._column is None:
+            self._column = self._model.first_column(observation)
+        else:
+            backtrack = np.empty((1, self._num_states), dtype=self._backtrack_dtype)
+            self._column = viterbi_engine.forward_pass(self._transition_matrix_a, emission[None, :], self._column,
+                                                       self._use_log_probabilities,
+                                                       backtrack=backtrack,
+                                                       product=self._product)
+            self._window.append(backtrack[0])
+
+        # Linear scores underflow on long streams, so keep them scaled to a max of one
+        if not self._use_log_probabilities:
+            scale = np.max(self._column)
+            if scale > 0:
+                self._column = self._column / scale
+                self._log_scale += np.log(scale)
+
+        self.num_observations += 1
+
+        finalized = self._finalize_converged()
+        if self._max_lag is not None and len(self._window) + 1 > self._max_lag:
+            finalized += self._finalize_oldest(len(self._window) + 1 - self._max_lag)
+
+        return self._to_state_space(finalized)
+
+    def flush(self):
+        """Ends the stream and returns every state not yet finalized"""
+
+        if self._column is None:
+            return []
+
+        last_state = int(np.argmax(self._column))
+
+        if (self._use_log_probabilities):
+            self.viterbi_probability = self._column[last_state]
+        else:
+            self.viterbi_probability = self._column[last_state] * np.exp(self._log_scale)
+
+        path = self._trace(last_state, len(self._window))
+        self._window.clear()
+        self._column = None
+        self.num_finalized += len(path)
+
+        return self._to_state_space(path)
+
+    def decode(self, observations):
+        """Generator yielding the Viterbi path of an observation iterator as it converges"""
+
+        for observation in observations:
+            for state in self.push(observation):
+                yield state
+
+        for state in self.flush():
+            yield state
+
+    def _trace(self, state, num_rows):
+        """Returns the states of the oldest num_rows+1 pending steps ending in state"""
+        path = [state]
+        for i in range(num_rows - 1, -1, -1):
+            state = int(self._window[i][state])
+            path.append(state)
+
+        path.reverse()
+        return path
+
+    def _finalize_converged(self):
+        """Finalizes every pending step on which all surviving paths agree"""
+        alive = np.ones(self._num_states, dtype=bool)
+        for i in range(len(self._window) - 1, -1, -1):
+            # Previous states still reachable from a surviving path
+            survivors = np.flatnonzero(alive)
+            alive[:] = False
+            alive[self._window[i][survivors]] = True
+
+            if np.count_nonzero(alive) == 1:
+                return self._pop(self._trace(int(np.flatnonzero(alive)[0]), i))
+
+        return []
+
+    def _finalize_oldest(self, count):
+        """Forces out the oldest pending steps along the currently best path"""
+        path = self._trace(int(np.argmax(self._column)), len(self._window))
+        return self._pop(path[:count])
+
+    def _pop(self, path):
+        """Drops the backtrack rows of newly finalized steps"""
+        for _ in range(len(path)):
+            self._window.popleft()
+
+        self.num_finalized += len(path)
+        return path
+
+    def _to_state_space(self, path):
+        """Converts state indices to the provided state space"""
+        if self._state_space is not None:
+            return [self._state_space[state] for state in path]
+        return path
+
+if __name__ == "__main__":
+    print(__file__)
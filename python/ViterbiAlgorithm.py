@@ -22,54 +22,83 @@
 # THE SOFTWARE. 
 import os
 import numpy as np
+import HiddenMarkovModel
 
 class ViterbiAlgorithm(object):
     """A class that implements the Viterbi Algorithm"""
 
-    def __init__(self, transition_matrix_a, emission_matrix_b, initial_state_array_i, observed_array_o, state_space=None, observation_space=None, use_log_probabilities=False):
-        """ Intialize Local Variables """
+    def __init__(self, transition_matrix_a, emission_matrix_b, initial_state_array_i, observed_array_o, state_space=None, observation_space=None, use_log_probabilities=False, memory_mode="full", dtype=np.float64, log_space_input=False, stats=None):
+        """ Intialize Local Variables
+
+        memory_mode selects how much of the recursion is kept:
+            "full": N x T score and backtrack matrices (default)
+            "low": rolling score column and a compact backtrack matrix
+            "checkpoint": a score column every sqrt(T) steps, segments are recomputed during backtrack
+
+        dtype and log_space_input are passed to HiddenMarkovModel.
+
+        stats is an optional decode_stats.DecodeStats. It is kept as self.stats
+        and collects the time of every phase from the log conversion to the
+        label conversion, the states x steps processed and the working bytes.
+        """
+
+        # Compile the model, then attach this sequence to it
+        model = HiddenMarkovModel.HiddenMarkovModel(transition_matrix_a, emission_matrix_b, initial_state_array_i,
+                                                    state_space=state_space,
+                                                    observation_space=observation_space,
+                                                    use_log_probabilities=use_log_probabilities,
+                                                    dtype=dtype,
+                                                    log_space_input=log_space_input,
+                                                    stats=stats)
+        self._setup(model, observed_array_o, memory_mode)
+        return
 
-        # Save Inputs
-        self._state_space = state_space
+    @classmethod
+    def from_model(cls, model, observed_array_o, memory_mode="full"):
+        """Creates a decoder for observed_array_o that reuses a compiled HiddenMarkovModel"""
+        v = cls.__new__(cls)
+        v._setup(model, observed_array_o, memory_mode)
+        return v
 
-        if observation_space == None:
-            self._observation_space = [i for i in range(len(emission_matrix_b[0]))]
-        else:
-            self._observation_space = observation_space
-        
-        # Setup Index Lookup for Observations
-        self._obs_to_index = dict()
-        for i in range(len(self._observation_space)):
-            self._obs_to_index[self._observation_space[i]] = i
-
-        self._use_log_probabilities = use_log_probabilities
-        self._transition_matrix_a = np.array(transition_matrix_a)
-        self._emission_matrix_b = np.array(emission_matrix_b)
-        self._initial_state_array_i = np.array(initial_state_array_i)
+    def _setup(self, model, observed_array_o, memory_mode):
+        """ Intialize Per Sequence State """
 
-        # Replace Observations with indices
-        if observation_space != None:
-            self._observed_array_o = np.array([self._obs_to_index[obs] for obs in observed_array_o])
-        else:
-            self._observed_array_o = np.array(observed_array_o)
+        if memory_mode not in ("full", "low", "checkpoint"):
+            raise ValueError("Unknown memory_mode: " + str(memory_mode))
+
+        # Save Inputs
+        self._model = model
+        self.stats = model.stats
+        self._memory_mode = memory_mode
+        self._state_space = model._state_space
+        self._observation_space = model._observation_space
+        self._obs_to_index = model._obs_to_index
+        self._use_log_probabilities = model._use_log_probabilities
+        self._transition_matrix_a = model._transition_matrix_a
+        self._emission_matrix_b = model._emission_matrix_b
+        self._initial_state_array_i = model._initial_state_array_i
 
-        # If using log probabilities, initialize matrices with small deltas to protect against zero
-        if (self._use_log_probabilities):
-            self._transition_matrix_a = np.log(self._transition_matrix_a + np.finfo(float).eps)
-            self._emission_matrix_b = np.log(self._emission_matrix_b + np.finfo(float).eps)
-            self._initial_state_array_i = np.log(self._initial_state_array_i + np.finfo(float).eps)
+        # Replace Observations with indices
+        self._observed_array_o = model.encode(observed_array_o)
 
         # Retrieve Sizes
-        self._num_states = self._transition_matrix_a.shape[0]
+        self._num_states = model.num_states
         self._num_observations = len(self._observed_array_o)
 
-        # Initialize Helpers
-        self._accumlated_probability_matrix = np.zeros((self._num_states, self._num_observations))
-        self._backtrack_matrix = np.zeros((self._num_states, self._num_observations-1), dtype=int)
+        # Working matrices are only kept in full mode, the others work in blocks
+        self._accumlated_probability_matrix = None
+        self._backtrack_matrix = None
+        self.peak_memory_bytes = 0
 
-        # Initialize Accumulated Probability Matrix
-        self._accumlated_probability_matrix[:, 0] = self._initial_state_array_i + \
-                                                 self._emission_matrix_b[:, 0]
+        if self._memory_mode == "full":
+            # Initialize Helpers, stored one row per step and exposed as (states x steps)
+            self._scores = np.zeros((self._num_observations, self._num_states), dtype=model.dtype)
+            self._backtrack = np.zeros((self._num_observations-1, self._num_states), dtype=int)
+            self._accumlated_probability_matrix = self._scores.T
+            self._backtrack_matrix = self._backtrack.T
+
+            # Initialize Accumulated Probability Matrix with the first observation
+            self._scores[0] = model.first_column(self._observed_array_o[0])
 
         # Create Optimial State Sequence
         self.viterbi_path = []
@@ -80,43 +109,18 @@ class ViterbiAlgorithm(object):
     def run(self):
         '''Execute Viterbi Algorithm'''
 
-        # Compute Accumulated Probability and Backtrack Matrices
-        for i in range(1,self._num_observations):
-            for j in range(self._num_states):
-                # Use Logs if requested
-                if (self._use_log_probabilities):
-                    product = self._transition_matrix_a[:, j] + \
-                              self._accumlated_probability_matrix[:, i-1]
-
-                    self._accumlated_probability_matrix[j, i] = \
-                        np.max(product) + self._emission_matrix_b[j, self._observed_array_o[i]]
-                else:
-                    product = np.multiply(self._transition_matrix_a[:, j], \
-                                          self._accumlated_probability_matrix[:, i-1])
-
-                    self._accumlated_probability_matrix[j, i] = \
-                        np.max(product) * self._emission_matrix_b[j, self._observed_array_o[i]]
-
-                # Update Backtract Matrix
-                self._backtrack_matrix[j, i-1] = np.argmax(product)
-
-        # Set Initial Path to 0
-        self.viterbi_path = np.zeros(self._num_observations, dtype=int)
-
-        # Set last entry to most likely state
-        self.viterbi_path[-1] = np.argmax(self._accumlated_probability_matrix[:, -1])
-
-        # Set Viterbi Probability
-        self.viterbi_probability = self._accumlated_probability_matrix[:, -1][self.viterbi_path[-1]]
+        if self._memory_mode == "full":
+            self.viterbi_path, self.viterbi_probability = \
+                self._model.decode_indices(self._observed_array_o, scores=self._scores, backtrack=self._backtrack)
+        else:
+            self.viterbi_path, self.viterbi_probability = \
+                self._model.decode_indices(self._observed_array_o, memory_mode=self._memory_mode)
 
-        # Starting from the end-1 to backtrack viterbi path
-        for i in range(self._num_observations-2, 0, -1):
-            self.viterbi_path[i] = \
-                self._backtrack_matrix[int(self.viterbi_path[i+1]), i]
+        self.peak_memory_bytes = self._model.peak_memory_bytes
 
         # If state space was provided, convert viterbi path to state space
         if self._state_space != None:
-            self.viterbi_path = [self._state_space[self.viterbi_path[i]] for i in range(len(self.viterbi_path))]
+            self.viterbi_path = self._model.to_state_space(self.viterbi_path)
 
         return
 
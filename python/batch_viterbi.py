@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import viterbi_engine
+import HiddenMarkovModel
+
+def batch_decode(transition_matrix_a, emission_matrix_b, initial_state_array_i, sequences, state_space=None, observation_space=None, use_log_probabilities=False):
+    """Decodes many variable length observation sequences against the same model
+
+    The model is converted once and every sequence is advanced together, one
+    (batch x states x states) broadcast per timestep. Sequences are sorted by
+    length so the ones still running always form a prefix of the batch, and
+    each step only stores backpointers for that prefix.
+
+    Args:
+        transition_matrix_a (nxn float list): Probability that state n+1 is selected after state n
+        emission_matrix_b (nxo float list): Probability that observation o is observed in state n
+        initial_state_array_i (1xn float list): Probability that state n is the first state
+        sequences (list): Observation sequences, each of any length
+        state_space (list): States representation
+        observation_space (list): Observation representation
+        use_log_probabilities (bool): Decode in log space
+
+    Returns:
+        paths (list): The most likely state sequence of each input sequence
+        probabilities (ndarray): Viterbi probability of each input sequence
+
+    """
+    model = HiddenMarkovModel.HiddenMarkovModel(transition_matrix_a, emission_matrix_b, initial_state_array_i,
+                                                state_space=state_space,
+                                                observation_space=observation_space,
+                                                use_log_probabilities=use_log_probabilities)
+    return model.decode_batch(sequences)
+
+def decode_encoded_batch(transition_matrix_a, emission_matrix_b, initial_state_array_i, sequences, use_log_probabilities, rescale=False):
+    """Decodes index coded sequences with matrices already in their decoding domain
+
+    Args:
+        transition_matrix_a (nxn ndarray): Transition matrix (log or linear)
+        emission_matrix_b (nxo ndarray): Emission matrix (log or linear)
+        initial_state_array_i (1xn ndarray): Initial state probabilities (log or linear)
+        sequences (list): Index coded observation sequences
+        use_log_probabilities (bool): Add scores instead of multiplying them
+        rescale (bool): Rescale every row to a max of one each step, for reduced precision
+
+    Returns:
+        paths (list): State index path of each sequence
+        probabilities (ndarray): Viterbi probability of each sequence
+
+    """
+    num_sequences = len(sequences)
+    num_states = transition_matrix_a.shape[0]
+    combine = np.add if use_log_probabilities else np.multiply
+
+    if num_sequences == 0:
+        return [], np.zeros(0)
+
+    lengths = np.array([len(sequence) for sequence in sequences])
+    if np.any(lengths == 0):
+        raise ValueError("Cannot decode an empty observation sequence")
+
+    # Longest first, so active sequences are always rows [0, active)
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    max_length = sorted_lengths[0]
+
+    # Sorted sequences laid end to end, step i of the running rows is flat[starts[:active] + i]
+    starts = np.zeros(num_sequences, dtype=np.intp)
+    np.cumsum(sorted_lengths[:-1], out=starts[1:])
+    flat = np.concatenate([np.asarray(sequences[row], dtype=np.intp) for row in order])
+
+    # Number of sequences still running at each step
+    active_counts = np.searchsorted(-sorted_lengths, -np.arange(max_length), side="left")
+
+    emission_rows = emission_matrix_b.T
+    scores = combine(initial_state_array_i, emission_rows[flat[starts]])
+    offsets = np.zeros(num_sequences)
+    if rescale:
+        _rescale_rows(scores, offsets, use_log_probabilities)
+
+    # One (active x states) backpointer block per step, so finished rows cost nothing
+    dtype = viterbi_engine.backtrack_dtype(num_states)
+    backtrack = []
+
+    # Forward Recursion over the whole batch
+    for i in range(1, max_length):
+        active = active_counts[i]
+
+        # Only the longest sequence is left, finish it with the single sequence engine
+        if active == 1:
+            tail = np.empty((max_length - i, num_states), dtype=dtype)
+            scores[0] = viterbi_engine.forward_pass(transition_matrix_a, emission_rows[flat[i:max_length]], scores[0],
+                                                    use_log_probabilities,
+                                                    backtrack=tail,
+                                                    scale=offsets[:1] if rescale else None)
+            backtrack.extend(tail[:, None, :])
+            break
+
+        product = combine(scores[:active, :, None], transition_matrix_a[None, :, :])
+        best = product.argmax(axis=1)
+        best_scores = np.take_along_axis(product, best[:, None, :], axis=1)[:, 0, :]
+
+        scores[:active] = combine(best_scores, emission_rows[flat[starts[:active] + i]])
+        backtrack.append(best.astype(dtype, copy=False))
+
+        if rescale:
+            _rescale_rows(scores[:active], offsets[:active], use_log_probabilities)
+
+    # Finished rows keep their last column, so the final state comes from the same scores
+    state = scores.argmax(axis=1)
+    probabilities = scores[np.arange(num_sequences), state].astype(float)
+    if rescale:
+        probabilities = probabilities + offsets if use_log_probabilities else probabilities * np.exp(offsets)
+
+    # Backtrack every sequence at once into the flat layout, rows join as t reaches their last step
+    flat_path = np.empty(len(flat), dtype=int)
+    for i in range(max_length - 1, -1, -1):
+        active = active_counts[i]
+        flat_path[starts[:active] + i] = state[:active]
+        if i > 0:
+            state[:active] = backtrack[i-1][np.arange(active), state[:active]]
+
+    # Restore Input Order
+    paths = [None] * num_sequences
+    for row in range(num_sequences):
+        paths[order[row]] = flat_path[starts[row]:starts[row] + sorted_lengths[row]]
+
+    result_probabilities = np.empty(num_sequences)
+    result_probabilities[order] = probabilities
+
+    return paths, result_probabilities
+
+def _rescale_rows(scores, offsets, use_log_probabilities):
+    """Rescales every row of scores in place to a max of one (zero in log space)"""
+    peaks = scores.max(axis=1)
+    if use_log_probabilities:
+        peaks = np.where(peaks > -np.inf, peaks, 0)
+        scores -= peaks[:, None]
+        offsets += peaks
+    else:
+        peaks = np.where(peaks > 0, peaks, 1)
+        scores /= peaks[:, None]
+        offsets += np.log(peaks)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from observation_encoding import ObservationEncoder
+from estimate_based_on_observation import SufficientStatistics, pretty_print
+from generate_observations import generate_observations
+
+def baum_welch(initial_state_probability, transition_matrix, emission_matrix, sequences, state_space=None, observation_space=None, runs=100, tolerance=1e-6, chunk_size=None, workers=None):
+    """Estimates HMM parameters with scaled forward-backward (Baum-Welch) EM
+
+    The E-step is sharded across a process pool and the expected counts of
+    every shard are reduced in the parent. A single long sequence can be
+    split with chunk_size. Every chunk then first computes its forward
+    operator in the pool, and the parent scans the operators for the forward
+    and backward messages at every chunk boundary and the expected count of
+    the transition across it. Each chunk's E-step starts from its forward
+    message and ends on its backward message, so the counts and the
+    log-likelihood are those of the whole sequence. The operator pass costs
+    about N times a forward pass.
+
+    Args:
+        initial_state_probability (1xn float list): Probability that state n is the first state
+        transition_matrix (nxn float list): Initial guess of the transition matrix
+        emission_matrix (nxo float list): Initial guess of the emission matrix
+        sequences (list): Observation sequences
+        state_space (list): States representation, only used for printing
+        observation_space (list): Observation representation
+        runs (int): Maximum number of EM iterations
+        tolerance (float): Stop once the log-likelihood improves by less than this
+        chunk_size (int): Split sequences into chunks of at most this many observations
+        workers (int): Number of processes, defaults to the cpu count
+
+    Returns:
+        initial_state_probability (1xn ndarray): Estimated initial state probability
+        transition_matrix (nxn ndarray): Estimated transition matrix
+        emission_matrix (nxo ndarray): Estimated emission matrix
+        history (list): Log-likelihood and per phase wall time of every iteration
+
+    """
+    initial_state_probability = np.array(initial_state_probability, dtype=float)
+    transition_matrix = np.array(transition_matrix, dtype=float)
+    emission_matrix = np.array(emission_matrix, dtype=float)
+    num_states, num_observations = emission_matrix.shape
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Encode once and cut into the units of work
+    encoder = ObservationEncoder(observation_space)
+    pieces = []
+    chains = []
+    for sequence in sequences:
+        observed = encoder.encode(sequence)
+        step = len(observed) if chunk_size is None else chunk_size
+        chains.append([])
+        for start in range(0, len(observed), max(step, 1)):
+            chains[-1].append(len(pieces))
+            pieces.append((observed[start:start+step], start == 0))
+
+    shards = _make_shards(pieces, workers)
+    chunked = any(len(chain) > 1 for chain in chains)
+
+    history = []
+    previous_log_likelihood = None
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pieces, shards)) if workers > 1 else None
+    if pool is None:
+        _init_worker(pieces, shards)
+    run = pool.map if pool is not None else map
+
+    try:
+        for i in range(runs):
+            # E-step: boundary messages between chunks, then expected counts of every shard
+            start = time.perf_counter()
+            starts = np.tile(initial_state_probability, (len(pieces), 1))
+            ends = np.ones((len(pieces), num_states))
+            boundary_counts = np.zeros((num_states, num_states))
+            if chunked:
+                operators = np.empty((len(pieces), num_states, num_states))
+                tasks = [(shard, transition_matrix, emission_matrix) for shard in range(len(shards))]
+                for shard, shard_operators in zip(shards, run(_chunk_operators, tasks)):
+                    operators[shard] = shard_operators
+                starts, ends, boundary_counts = _boundary_messages(chains, operators, transition_matrix,
+                                                                   initial_state_probability)
+
+            tasks = [(shard, transition_matrix, emission_matrix, starts[shards[shard]], ends[shards[shard]])
+                     for shard in range(len(shards))]
+            results = run(_e_step, tasks)
+
+            log_likelihood = 0.0
+            initial_counts = np.zeros(num_states)
+            statistics = SufficientStatistics(num_states, num_observations)
+            statistics.transition_counts += boundary_counts
+            for shard_log_likelihood, shard_initial, shard_transitions, shard_emissions in results:
+                log_likelihood += shard_log_likelihood
+                initial_counts += shard_initial
+                statistics.transition_counts += shard_transitions
+                statistics.emission_counts += shard_emissions
+            e_step_seconds = time.perf_counter() - start
+
+            # M-step: normalize the reduced counts
+            start = time.perf_counter()
+            if initial_counts.sum() > 0:
+                initial_state_probability = initial_counts / initial_counts.sum()
+            transition_matrix, emission_matrix = statistics.normalize(transition_matrix, emission_matrix)
+            m_step_seconds = time.perf_counter() - start
+
+            history.append({"run": i+1,
+                            "log_likelihood": log_likelihood,
+                            "e_step_seconds": e_step_seconds,
+                            "m_step_seconds": m_step_seconds})
+
+            print("Run " + str(i+1) + " Log Likelihood: " + str(log_likelihood) +
+                  f" (E-step {e_step_seconds:.3f}s, M-step {m_step_seconds:.3f}s)")
+
+            # The likelihood reported is that of the parameters before this update
+            if previous_log_likelihood is not None and abs(log_likelihood - previous_log_likelihood) < tolerance:
+                print("Converged after " + str(i+1) + " Runs")
+                break
+
+            previous_log_likelihood = log_likelihood
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return initial_state_probability, transition_matrix, emission_matrix, history
+
+def forward_backward_statistics(transition_matrix, emission_matrix, start_probabilities, sequences, end_messages=None):
+    """Expected counts of a group of index coded sequences, decoded together
+
+    The scaled forward and backward passes advance every sequence at once.
+    Sequences are sorted by length so the running ones always form a prefix.
+
+    Args:
+        transition_matrix (nxn ndarray): Transition matrix
+        emission_matrix (nxo ndarray): Emission matrix
+        start_probabilities (sxn ndarray): Distribution of the first state of each sequence
+        sequences (list): Index coded observation sequences
+        end_messages (sxn ndarray): Backward message after the last state of each
+            sequence, up to scale. Defaults to ones, the end of a whole sequence
+
+    Returns:
+        log_likelihood (float): Sum of the sequence log-likelihoods
+        gamma_start (sxn ndarray): Posterior of the first state of each sequence
+        transition_counts (nxn ndarray): Expected transition counts
+        emission_counts (nxo ndarray): Expected emission counts
+
+    """
+    num_sequences = len(sequences)
+    num_states, num_observations = emission_matrix.shape
+    tiny = np.finfo(float).tiny
+
+    lengths = np.array([len(sequence) for sequence in sequences])
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    max_length = sorted_lengths[0]
+    active_counts = np.searchsorted(-sorted_lengths, -np.arange(max_length + 1), side="left")
+
+    # Padded (time x sequence) observations and their emission rows
+    padded = np.zeros((max_length, num_sequences), dtype=np.intp)
+    for row in range(num_sequences):
+        padded[:sorted_lengths[row], row] = sequences[order[row]]
+    emissions = emission_matrix.T[padded]
+
+    # Scaled Forward Pass, padding keeps alpha at zero and the scale at one
+    alpha = np.zeros((max_length, num_sequences, num_states))
+    scale = np.ones((max_length, num_sequences))
+
+    alpha[0] = np.asarray(start_probabilities)[order] * emissions[0]
+    scale[0] = np.maximum(alpha[0].sum(axis=1), tiny)
+    alpha[0] /= scale[0][:, None]
+
+    for t in range(1, max_length):
+        active = active_counts[t]
+        alpha[t, :active] = (alpha[t-1, :active] @ transition_matrix) * emissions[t, :active]
+        scale[t, :active] = np.maximum(alpha[t, :active].sum(axis=1), tiny)
+        alpha[t, :active] /= scale[t, :active, None]
+
+    # Scaled Backward Pass, weighted holds emission * beta / scale of the next step
+    beta = np.ones((max_length, num_sequences, num_states))
+    weighted = np.zeros((max_length, num_sequences, num_states))
+
+    # Scale each end message so the posterior of the last state sums to one
+    if end_messages is not None:
+        last = alpha[sorted_lengths - 1, np.arange(num_sequences)]
+        ends = np.asarray(end_messages)[order]
+        beta[sorted_lengths - 1, np.arange(num_sequences)] = \
+            ends / np.maximum((last * ends).sum(axis=1), tiny)[:, None]
+
+    for t in range(max_length - 1, 0, -1):
+        active = active_counts[t]
+        weighted[t, :active] = emissions[t, :active] * beta[t, :active] / scale[t, :active, None]
+        beta[t-1, :active] = weighted[t, :active] @ transition_matrix.T
+
+    gamma = alpha * beta
+
+    # Expected Counts
+    transition_counts = transition_matrix * np.einsum("tsi,tsj->ij", alpha[:-1], weighted[1:])
+
+    emission_counts = np.zeros((num_states, num_observations))
+    for k in range(num_states):
+        emission_counts[k] = np.bincount(padded.ravel(), weights=gamma[:, :, k].ravel(), minlength=num_observations)
+
+    gamma_start = np.empty((num_sequences, num_states))
+    gamma_start[order] = gamma[0]
+
+    return np.log(scale).sum(), gamma_start, transition_counts, emission_counts
+
+def forward_operators(transition_matrix, emission_matrix, sequences):
+    """Forward operator of each index coded sequence, advanced together
+
+    Entry [i, j] is proportional to the probability of the whole sequence and
+    of ending in state j, given that it starts in state i. Every operator is
+    rescaled to a max of one each step, the scale is not kept.
+
+    Returns:
+        operators (sxnxn ndarray): Forward operator of every sequence
+
+    """
+    num_sequences = len(sequences)
+    num_states = transition_matrix.shape[0]
+
+    lengths = np.array([len(sequence) for sequence in sequences])
+    order = np.argsort(-lengths, kind="stable")
+    sorted_lengths = lengths[order]
+    active_counts = np.searchsorted(-sorted_lengths, -np.arange(sorted_lengths[0]), side="left")
+
+    emission_rows = emission_matrix.T
+    operators = np.zeros((num_sequences, num_states, num_states))
+    diagonal = np.arange(num_states)
+    operators[:, diagonal, diagonal] = emission_rows[[sequences[row][0] for row in order]]
+
+    for t in range(1, sorted_lengths[0]):
+        active = active_counts[t]
+        step = emission_rows[[sequences[row][t] for row in order[:active]]]
+        operators[:active] = (operators[:active] @ transition_matrix) * step[:, None, :]
+        peaks = operators[:active].max(axis=(1, 2))
+        operators[:active] /= np.where(peaks > 0, peaks, 1)[:, None, None]
+
+    result = np.empty_like(operators)
+    result[order] = operators
+    return result
+
+def _boundary_messages(chains, operators, transition_matrix, initial_state_probability):
+    """ Start distribution and end message of every chunk, and the expected transitions across boundaries
+
+    The forward scan filters the last state of each chunk and predicts the
+    first state of the next one. The backward scan carries the message of
+    every later observation back to the end of each chunk.
+    """
+    num_states = transition_matrix.shape[0]
+    starts = np.empty((len(operators), num_states))
+    ends = np.ones((len(operators), num_states))
+    boundary_counts = np.zeros((num_states, num_states))
+
+    for chain in chains:
+        # Forward: start of each chunk and posterior of its last state given the chunks so far
+        start = initial_state_probability
+        filtered = []
+        for piece in chain:
+            starts[piece] = start
+            last = start @ operators[piece]
+            filtered.append(last / max(last.sum(), np.finfo(float).tiny))
+            start = filtered[-1] @ transition_matrix
+
+        # Backward: message of every later observation, and the transition into each chunk
+        end = np.ones(num_states)
+        for c in range(len(chain) - 1, 0, -1):
+            ends[chain[c]] = end
+            entry = operators[chain[c]] @ end
+            pair = filtered[c-1][:, None] * transition_matrix * entry[None, :]
+            boundary_counts += pair / max(pair.sum(), np.finfo(float).tiny)
+
+            end = transition_matrix @ entry
+            end /= max(end.max(), np.finfo(float).tiny)
+        ends[chain[0]] = end
+
+    return starts, ends, boundary_counts
+
+def _make_shards(pieces, num_shards):
+    """ Deals piece indices to shards, longest first, always onto the lightest shard """
+    shards = [[] for _ in range(max(min(num_shards, len(pieces)), 1))]
+    loads = np.zeros(len(shards))
+    for index in sorted(range(len(pieces)), key=lambda i: -len(pieces[i][0])):
+        lightest = int(np.argmin(loads))
+        shards[lightest].append(index)
+        loads[lightest] += len(pieces[index][0])
+    return shards
+
+# Per process state for baum_welch
+_worker = dict()
+
+def _init_worker(pieces, shards):
+    """ Keeps the encoded pieces in every process so only parameters travel per iteration """
+    _worker["pieces"] = pieces
+    _worker["shards"] = shards
+
+def _chunk_operators(task):
+    """ Forward operators of one shard's pieces """
+    shard, transition_matrix, emission_matrix = task
+    pieces = [_worker["pieces"][piece] for piece in _worker["shards"][shard]]
+    if len(pieces) == 0:
+        return np.zeros((0,) + transition_matrix.shape)
+    return forward_operators(transition_matrix, emission_matrix, [observed for observed, _ in pieces])
+
+def _e_step(task):
+    """ Expected counts of one shard """
+    shard, transition_matrix, emission_matrix, start_probabilities, end_messages = task
+    pieces = [_worker["pieces"][piece] for piece in _worker["shards"][shard]]
+
+    if len(pieces) == 0:
+        num_states, num_observations = emission_matrix.shape
+        return 0.0, np.zeros(num_states), np.zeros((num_states, num_states)), np.zeros((num_states, num_observations))
+
+    sequences = [observed for observed, _ in pieces]
+    is_start = np.array([first for _, first in pieces])
+
+    log_likelihood, gamma_start, transition_counts, emission_counts = \
+        forward_backward_statistics(transition_matrix, emission_matrix, start_probabilities, sequences,
+                                    end_messages=end_messages)
+
+    # Only true sequence starts inform the initial state probability
+    return log_likelihood, gamma_start[is_start].sum(axis=0), transition_counts, emission_counts
+
+if __name__ == "__main__":
+    print(__file__)
+
+    # Initial State Probability
+    initial_state_probability = [0.9999, 0.0001]
+
+    # Transition Matrix
+    transition_matrix = [[0.95, 0.05],\
+                        [0.05, 0.95]]
+
+    # Emission Matrix
+    emission_matrix = [[1/6, 1/6, 1/6, 1/6, 1/6, 1/6],\
+                      [0.04, 0.04, 0.04, 0.04, 0.04, 0.8]]
+
+    state_space=['Fair','Loaded']
+    observation_space=['1', '2', '3', '4', '5', '6']
+
+    print("Truth:")
+    pretty_print(initial_state_probability, transition_matrix, emission_matrix, state_space, observation_space)
+
+    true_state, dice_rolls = generate_observations(initial_state_probability, transition_matrix, emission_matrix,
+                                            num_samples=1000000,
+                                            state_space=state_space,
+                                            observation_space=observation_space,
+                                            seed=515)
+
+    # Transition Matrix
+    estimated_transition_matrix = [[0.95, 0.05],\
+                                   [0.10, 0.90]]
+
+    # Emission Matrix
+    estimated_emission_matrix = [[1/6, 1/6, 1/6, 1/6, 1/6, 1/6],\
+                                 [0.1, 0.1, 0.1, 0.1, 0.1, 0.5]]
+
+    _, estimated_transition_matrix, estimated_emission_matrix, _ = \
+        baum_welch(initial_state_probability, estimated_transition_matrix, estimated_emission_matrix,
+                   [dice_rolls],
+                   observation_space=observation_space,
+                   runs=50,
+                   chunk_size=10000)
+
+    print("\nEstimated: ")
+    pretty_print(initial_state_probability, estimated_transition_matrix, estimated_emission_matrix, state_space, observation_space)
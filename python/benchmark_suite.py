@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import ViterbiAlgorithm
+from benchmark_viterbi import random_model, loaded_die_model
+from estimate_based_on_observation import updateMatricesAfterRun, runLoop
+from generate_observations import generate_observations
+from tabulate import tabulate
+
+# Baseline stored next to this file, refreshed with --save-baseline
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Allowed slowdown and memory growth before a case is flagged
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.10
+
+def measure(function, repeats=3):
+    """ Best wall time over repeats, then the peak traced memory of one more call
+
+    Timing and tracing are kept apart since tracemalloc slows allocation down.
+    """
+    seconds = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak_bytes
+
+def run_cases(quick=False, seed=515):
+    """ Builds the benchmark cases as (name, params, items, function)
+
+    items is the number of observations processed per call, used for throughput.
+    """
+    state_counts = (2, 10) if quick else (2, 10, 50)
+    sequence_lengths = (1000,) if quick else (1000, 10000)
+
+    cases = []
+
+    # ViterbiAlgorithm.run across sizes and modes
+    for use_log_probabilities in (True, False):
+        for num_states in state_counts:
+            initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+
+            for num_observations in sequence_lengths:
+                observations = np.random.default_rng(seed).integers(0, 6, num_observations)
+
+                def run(a=transition_matrix, b=emission_matrix, pi=initial_state_probability, o=observations,
+                        log=use_log_probabilities):
+                    ViterbiAlgorithm.ViterbiAlgorithm(a, b, pi, o, use_log_probabilities=log).run()
+
+                cases.append(("run", {"states": num_states, "steps": num_observations, "log": use_log_probabilities},
+                              num_observations, run))
+
+    # generate_observations throughput, labelled and index coded
+    initial_state_probability, transition_matrix, emission_matrix = loaded_die_model()
+    num_samples = 100000 if quick else 1000000
+    for return_indices in (False, True):
+        def generate(r=return_indices):
+            generate_observations(initial_state_probability, transition_matrix, emission_matrix,
+                                  num_samples=num_samples,
+                                  state_space=['F', 'L'],
+                                  observation_space=['1', '2', '3', '4', '5', '6'],
+                                  seed=seed,
+                                  return_indices=r)
+
+        cases.append(("generate_observations", {"samples": num_samples, "indices": return_indices}, num_samples, generate))
+
+    # Re-estimation from a decoded path, and full training iterations
+    state_space = ['F', 'L']
+    observation_space = ['1', '2', '3', '4', '5', '6']
+    states, observations = generate_observations(initial_state_probability, transition_matrix, emission_matrix,
+                                                 num_samples=num_samples,
+                                                 state_space=state_space,
+                                                 observation_space=observation_space,
+                                                 seed=seed)
+
+    def update():
+        updateMatricesAfterRun(states, observations, state_space, observation_space)
+
+    cases.append(("updateMatricesAfterRun", {"samples": num_samples}, num_samples, update))
+
+    runs = 3
+    def train():
+        with contextlib.redirect_stdout(io.StringIO()):
+            runLoop(initial_state_probability, [[0.8, 0.2], [0.3, 0.7]], [[1/6] * 6, [0.2] * 5 + [0.0]],
+                    observations,
+                    state_space=state_space,
+                    observation_space=observation_space,
+                    runs=runs)
+
+    cases.append(("runLoop", {"samples": num_samples, "runs": runs}, num_samples * runs, train))
+
+    return cases
+
+def run_suite(quick=False, repeats=3, seed=515):
+    """ Runs every case and returns the JSON serializable report """
+    results = []
+    for name, params, items, function in run_cases(quick=quick, seed=seed):
+        seconds, peak_bytes = measure(function, repeats=repeats)
+        results.append({"name": name,
+                        "params": params,
+                        "seconds": seconds,
+                        "peak_bytes": int(peak_bytes),
+                        "items_per_second": items / seconds})
+
+    return {"meta": {"python": platform.python_version(),
+                     "numpy": np.__version__,
+                     "machine": platform.machine(),
+                     "processor": platform.processor(),
+                     "cpu_count": os.cpu_count(),
+                     "quick": quick,
+                     "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results}
+
+def case_key(result):
+    """ Identifies a case across reports """
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+def compare(report, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """ Marks every result against the matching baseline case
+
+    Returns:
+        rows (list): Table rows for the report
+        regressions (list): Keys of cases slower or larger than the tolerance allows
+
+    """
+    previous = {case_key(result): result for result in baseline["results"]}
+
+    rows = []
+    regressions = []
+    for result in report["results"]:
+        key = case_key(result)
+        old = previous.get(key)
+        if old is None:
+            rows.append([key, f"{result['seconds']:.4f}", "-", "-", f"{result['peak_bytes'] / 2**20:.1f}", "-", "new"])
+            continue
+
+        time_ratio = result["seconds"] / old["seconds"]
+        memory_ratio = result["peak_bytes"] / max(old["peak_bytes"], 1)
+        regressed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+        if regressed:
+            regressions.append(key)
+
+        rows.append([key, f"{result['seconds']:.4f}", f"{old['seconds']:.4f}", f"{time_ratio:.2f}x",
+                     f"{result['peak_bytes'] / 2**20:.1f}", f"{memory_ratio:.2f}x", "REGRESSION" if regressed else "ok"])
+
+    return rows, regressions
+
+def print_report(report):
+    """ Prints the results without a baseline """
+    rows = [[case_key(result), f"{result['seconds']:.4f}", f"{result['items_per_second']:.0f}",
+             f"{result['peak_bytes'] / 2**20:.1f}"] for result in report["results"]]
+    print(tabulate(rows, ["Case", "Time (s)", "Items/s", "Peak (MiB)"], tablefmt="github"))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the Viterbi decoder, sampler and training loop")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", nargs="?", const=BASELINE_PATH,
+                        help="Compare against a JSON report (default: the stored baseline)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast check")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed calls per case, the best is kept")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run_suite(quick=args.quick, repeats=args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline is None:
+        print_report(report)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    rows, regressions = compare(report, baseline,
+                                time_tolerance=args.time_tolerance,
+                                memory_tolerance=args.memory_tolerance)
+    print(tabulate(rows, ["Case", "Time (s)", "Baseline (s)", "Ratio", "Peak (MiB)", "Ratio", "Status"],
+                   tablefmt="github"))
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {args.baseline}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import time
+import numpy as np
+import ViterbiAlgorithm
+import batch_viterbi
+import parallel_viterbi
+from HiddenMarkovModel import HiddenMarkovModel
+from sparse_transitions import SparseTransitions
+from decode_stats import DecodeStats
+from IncrementalViterbi import IncrementalViterbi
+from tabulate import tabulate
+
+# float32 against float64: largest relative log probability error, and smallest fraction of matching path steps
+PRECISION_TOLERANCE = 1e-6
+PATH_MATCH_FRACTION = 0.999
+
+def random_model(num_states, num_symbols, seed=None):
+    """ Creates a random, row normalized HMM """
+    rng = np.random.default_rng(seed)
+
+    transition_matrix = rng.random((num_states, num_states))
+    transition_matrix /= transition_matrix.sum(axis=1, keepdims=True)
+
+    emission_matrix = rng.random((num_states, num_symbols))
+    emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+
+    initial_state_probability = rng.random(num_states)
+    initial_state_probability /= initial_state_probability.sum()
+
+    return initial_state_probability, transition_matrix, emission_matrix
+
+def reference_run(transition_matrix, emission_matrix, initial_state_probability, observations, use_log_probabilities):
+    """ Per state loop implementation of the recursion, used as the baseline
+
+    This is the original loop with its fixes applied: the first column uses
+    the first observation (and multiplies in linear mode) and path[0] is
+    backtracked instead of left at 0.
+    """
+    a = np.array(transition_matrix)
+    b = np.array(emission_matrix)
+    pi = np.array(initial_state_probability)
+
+    if use_log_probabilities:
+        a = np.log(a + np.finfo(float).eps)
+        b = np.log(b + np.finfo(float).eps)
+        pi = np.log(pi + np.finfo(float).eps)
+
+    num_states = a.shape[0]
+    num_observations = len(observations)
+
+    accumulated = np.zeros((num_states, num_observations))
+    backtrack = np.zeros((num_states, num_observations-1), dtype=int)
+
+    if use_log_probabilities:
+        accumulated[:, 0] = pi + b[:, observations[0]]
+    else:
+        accumulated[:, 0] = pi * b[:, observations[0]]
+
+    for i in range(1, num_observations):
+        for j in range(num_states):
+            if use_log_probabilities:
+                product = a[:, j] + accumulated[:, i-1]
+                accumulated[j, i] = np.max(product) + b[j, observations[i]]
+            else:
+                product = np.multiply(a[:, j], accumulated[:, i-1])
+                accumulated[j, i] = np.max(product) * b[j, observations[i]]
+
+            backtrack[j, i-1] = np.argmax(product)
+
+    path = np.zeros(num_observations, dtype=int)
+    path[-1] = np.argmax(accumulated[:, -1])
+    for i in range(num_observations-2, -1, -1):
+        path[i] = backtrack[path[i+1], i]
+
+    return path, accumulated[path[-1], -1]
+
+def bench_engine(state_counts=(2, 10, 50), sequence_lengths=(1000, 10000), use_log_probabilities=True, seed=515):
+    """ Times the vectorized run() against the per state loop """
+    rows = []
+    for num_states in state_counts:
+        initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+
+        for num_observations in sequence_lengths:
+            observations = np.random.default_rng(seed).integers(0, 6, num_observations)
+
+            start = time.perf_counter()
+            expected_path, expected_probability = reference_run(transition_matrix, emission_matrix,
+                                                                initial_state_probability, observations,
+                                                                use_log_probabilities)
+            reference_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            v = ViterbiAlgorithm.ViterbiAlgorithm(transition_matrix, emission_matrix, initial_state_probability,
+                                                  observations,
+                                                  use_log_probabilities=use_log_probabilities)
+            v.run()
+            vectorized_time = time.perf_counter() - start
+
+            identical = np.array_equal(v.viterbi_path, expected_path) and v.viterbi_probability == expected_probability
+
+            rows.append([num_states, num_observations, f"{reference_time:.3f}", f"{vectorized_time:.3f}",
+                         f"{reference_time / vectorized_time:.1f}x", str(identical)])
+
+    print(tabulate(rows, ["States", "Steps", "Loop (s)", "Vectorized (s)", "Speedup", "Identical"], tablefmt="github"))
+    return rows
+
+def bench_batch(batch_sizes=(1, 10, 100, 1000), num_states=10, max_length=100, seed=515):
+    """ Times batch_decode against one ViterbiAlgorithm per sequence """
+    initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for batch_size in batch_sizes:
+        sequences = [rng.integers(0, 6, rng.integers(1, max_length + 1)) for _ in range(batch_size)]
+
+        start = time.perf_counter()
+        for sequence in sequences:
+            v = ViterbiAlgorithm.ViterbiAlgorithm(transition_matrix, emission_matrix, initial_state_probability,
+                                                  sequence,
+                                                  use_log_probabilities=True)
+            v.run()
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch_viterbi.batch_decode(transition_matrix, emission_matrix, initial_state_probability, sequences,
+                                   use_log_probabilities=True)
+        batch_time = time.perf_counter() - start
+
+        rows.append([batch_size, f"{batch_size / single_time:.0f}", f"{batch_size / batch_time:.0f}",
+                     f"{single_time / batch_time:.1f}x"])
+
+    print(tabulate(rows, ["Sequences", "Single (seq/s)", "Batch (seq/s)", "Speedup"], tablefmt="github"))
+    return rows
+
+def bench_parallel(worker_counts=(1, 2, 4, 8), num_states=4, num_observations=200000, seed=515):
+    """ Times parallel_decode of one long sequence across core counts """
+    initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    observations = np.random.default_rng(seed).integers(0, 6, num_observations)
+
+    start = time.perf_counter()
+    expected_path, expected_probability = model.decode(observations)
+    sequential_time = time.perf_counter() - start
+
+    rows = [["sequential", f"{sequential_time:.3f}", "1.0x", "True"]]
+    for workers in worker_counts:
+        start = time.perf_counter()
+        path, probability = parallel_viterbi.parallel_decode(model, observations, workers=workers)
+        parallel_time = time.perf_counter() - start
+
+        identical = np.array_equal(path, expected_path) and probability == expected_probability
+        rows.append([workers, f"{parallel_time:.3f}", f"{sequential_time / parallel_time:.1f}x", str(identical)])
+
+    print(tabulate(rows, ["Workers", "Time (s)", "Speedup", "Identical"], tablefmt="github"))
+    return rows
+
+def bench_sparse(state_counts=(8, 32, 128, 512, 1024), num_observations=200, seed=515):
+    """ Times dense against banded sparse transitions on a left-to-right model
+
+    Linear probabilities keep impossible transitions at exactly zero in both
+    forms (log mode gives dense zeros log(eps) rather than -inf), so the
+    sequences are kept short enough not to underflow.
+    """
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for num_states in state_counts:
+        # Stay, advance or skip one state
+        bands = {0: np.full(num_states, 0.6), 1: np.full(num_states, 0.3), 2: np.full(num_states, 0.1)}
+        sparse = SparseTransitions.from_banded(bands)
+        dense = sparse.to_dense()
+
+        emission_matrix = rng.random((num_states, 6))
+        emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+        initial_state_probability = np.full(num_states, 1.0 / num_states)
+        observations = rng.integers(0, 6, num_observations)
+
+        timings = []
+        results = []
+        for transitions in (dense, sparse):
+            model = HiddenMarkovModel(transitions, emission_matrix, initial_state_probability)
+            start = time.perf_counter()
+            results.append(model.decode(observations))
+            timings.append(time.perf_counter() - start)
+
+        identical = np.array_equal(results[0][0], results[1][0]) and results[0][1] == results[1][1]
+        rows.append([num_states, sparse.nnz, f"{timings[0]:.3f}", f"{timings[1]:.3f}",
+                     f"{timings[0] / timings[1]:.1f}x", str(identical)])
+
+    print(tabulate(rows, ["States", "Nonzero", "Dense (s)", "Sparse (s)", "Speedup", "Identical"], tablefmt="github"))
+    return rows
+
+def loaded_die_model():
+    """ The two state loaded die model of example_viterbi """
+    initial_state_probability = [0.9999, 0.0001]
+    transition_matrix = [[0.95, 0.05],
+                         [0.10, 0.90]]
+    emission_matrix = [[1/6, 1/6, 1/6, 1/6, 1/6, 1/6],
+                       [0.1, 0.1, 0.1, 0.1, 0.1, 0.5]]
+    return initial_state_probability, transition_matrix, emission_matrix
+
+def precision_models(seed=515):
+    """ The models float32 decoding is checked on: the loaded die and a random 50 state model """
+    return [("loaded die", loaded_die_model()), ("random 50", random_model(50, 6, seed=seed))]
+
+def bench_precision(sequence_lengths=(300, 10000, 100000), seed=515):
+    """ Compares float32 decoding with float64 on the loaded die and a random model
+
+    float32 scores are rescaled every step, so the error does not grow with T,
+    but near ties between paths may still resolve differently. A run is within
+    tolerance when the log probabilities agree to PRECISION_TOLERANCE
+    (relative) and at least PATH_MATCH_FRACTION of the path steps match.
+    test_precision.py asserts the same bounds.
+    """
+    models = precision_models(seed)
+
+    rows = []
+    for name, (initial_state_probability, transition_matrix, emission_matrix) in models:
+        num_symbols = np.shape(emission_matrix)[1]
+        exact = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                  use_log_probabilities=True)
+        reduced = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                    use_log_probabilities=True,
+                                    dtype=np.float32)
+
+        for num_observations in sequence_lengths:
+            observations = np.random.default_rng(seed).integers(0, num_symbols, num_observations)
+
+            start = time.perf_counter()
+            expected_path, expected_probability = exact.decode_indices(observations)
+            exact_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            path, probability = reduced.decode_indices(observations)
+            reduced_time = time.perf_counter() - start
+
+            relative_error = abs(probability - expected_probability) / abs(expected_probability)
+            matching = np.mean(path == expected_path)
+            rows.append([name, num_observations, f"{exact_time:.3f}", f"{reduced_time:.3f}",
+                         f"{matching:.5f}", f"{relative_error:.1e}",
+                         str(relative_error <= PRECISION_TOLERANCE and matching >= PATH_MATCH_FRACTION)])
+
+    print(tabulate(rows, ["Model", "Steps", "float64 (s)", "float32 (s)", "Path Match", "Rel. Error", "Within Tolerance"],
+                   tablefmt="github"))
+    return rows
+
+def bench_instrumentation(num_sequences=2000, num_states=10, num_observations=100, seed=515):
+    """ Times many short decodes with and without a DecodeStats attached
+
+    Short sequences make the fixed per decode cost of the hooks as visible as it gets.
+    """
+    initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+    rng = np.random.default_rng(seed)
+    sequences = [rng.integers(0, 6, num_observations) for _ in range(num_sequences)]
+
+    rows = []
+    timings = []
+    for stats in (None, DecodeStats()):
+        model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                  use_log_probabilities=True,
+                                  stats=stats)
+        start = time.perf_counter()
+        for sequence in sequences:
+            model.decode_indices(sequence)
+        timings.append(time.perf_counter() - start)
+
+        rows.append(["disabled" if stats is None else "enabled", f"{timings[-1]:.3f}",
+                     f"{timings[-1] / timings[0]:.3f}x"])
+
+    print(tabulate(rows, ["Instrumentation", "Time (s)", "Relative"], tablefmt="github"))
+    return rows
+
+def bench_incremental(num_observations=100000, num_updates=20, update_size=10, num_states=10, seed=515):
+    """ Times appends and tail edits through IncrementalViterbi against a full decode after each change """
+    initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=seed)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    rng = np.random.default_rng(seed)
+    observations = rng.integers(0, 6, num_observations)
+    incremental = IncrementalViterbi(model, observations)
+    incremental.decode_indices()
+
+    rows = []
+    for operation in ("append", "edit"):
+        full_time = 0.0
+        incremental_time = 0.0
+        identical = True
+        for _ in range(num_updates):
+            update = rng.integers(0, 6, update_size)
+
+            start = time.perf_counter()
+            if operation == "append":
+                incremental.append(update)
+                observations = np.concatenate([observations, update])
+            else:
+                position = len(observations) - 2 * update_size
+                incremental.edit(position, update)
+                observations[position:position + update_size] = update
+            path, probability = incremental.decode_indices()
+            incremental_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            expected_path, expected_probability = model.decode_indices(observations)
+            full_time += time.perf_counter() - start
+
+            identical &= np.array_equal(path, expected_path) and probability == expected_probability
+
+        rows.append([operation, num_updates, f"{full_time / num_updates * 1000:.2f}",
+                     f"{incremental_time / num_updates * 1000:.2f}", f"{full_time / incremental_time:.0f}x", str(identical)])
+
+    print(tabulate(rows, ["Update", "Count", "Full (ms)", "Incremental (ms)", "Speedup", "Identical"], tablefmt="github"))
+    return rows
+
+if __name__ == "__main__":
+    print("Log Probabilities:")
+    bench_engine(use_log_probabilities=True)
+    print("")
+
+    print("Linear Probabilities:")
+    bench_engine(state_counts=(2, 10), sequence_lengths=(200, 1000), use_log_probabilities=False)
+    print("")
+
+    print("Batched Decoding:")
+    bench_batch()
+    print("")
+
+    print("Parallel Decoding of One Sequence:")
+    bench_parallel()
+    print("")
+
+    print("Sparse Transitions:")
+    bench_sparse()
+    print("")
+
+    print("Reduced Precision:")
+    bench_precision()
+    print("")
+
+    print("Instrumentation Overhead:")
+    bench_instrumentation()
+    print("")
+
+    print("Incremental Re-decoding:")
+    bench_incremental()
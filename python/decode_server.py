@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from model_io import cached_load_model
+from viterbi_cli import decode_chunk
+
+# Longest request line accepted, in bytes
+LINE_LIMIT = 1 << 24
+
+class DecodeServer(object):
+    """Asyncio decode server that micro-batches concurrent requests per model
+
+    The protocol is one JSON object per line in each direction:
+        {"id": 1, "model": "die", "observations": ["1", "6", "6"]}
+            -> {"id": 1, "path": ["F", "L", "L"], "score": -5.1}
+        {"id": 2, "op": "metrics"}
+            -> {"id": 2, "metrics": {...}}
+    Failed requests get {"id": ..., "error": "..."}. Requests on one
+    connection are handled concurrently, so responses may arrive out of order.
+
+    Requests for the same model are queued together. A batch is sent to the
+    executor once max_batch_size requests are waiting, or max_wait seconds
+    after the first one arrived, and decoded with decode_batch. At most
+    max_in_flight batches are in the executor at once, further requests wait
+    in their queue, where they show up in queue_depth and keep filling batches.
+    """
+
+    def __init__(self, models, max_batch_size=64, max_wait=0.005, executor=None, max_in_flight=None):
+        """ Intialize Local Variables
+
+        Args:
+            models (dict): Model name to model file path, clients can only use these
+            max_batch_size (int): Most requests decoded together
+            max_wait (float): Seconds the first request of a batch waits for more
+            executor (Executor): Runs the decoding, defaults to a thread pool
+            max_in_flight (int): Most batches in the executor at once, defaults to the cpu count
+
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        if max_in_flight is None:
+            max_in_flight = os.cpu_count() or 1
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        self._models = dict(models)
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._executor = executor if executor is not None else ThreadPoolExecutor()
+        self._queues = {name: [] for name in self._models}
+        self._flushers = dict()
+        self._batch_ready = {name: asyncio.Event() for name in self._models}
+        self._max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._batches = set()
+
+        # Metrics
+        self._batch_sizes = Counter()
+        self._in_flight = 0
+        self._requests = 0
+        self._errors = 0
+        self._decode_seconds = 0.0
+        self._started = time.time()
+        return
+
+    def metrics(self):
+        """Queue depths, batch size distribution and request counters"""
+        num_batches = sum(self._batch_sizes.values())
+        batched = sum(size * count for size, count in self._batch_sizes.items())
+        return {"queue_depth": {name: len(queue) for name, queue in self._queues.items()},
+                "total_queue_depth": sum(len(queue) for queue in self._queues.values()),
+                "batches_in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "batches": num_batches,
+                "batch_sizes": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "mean_batch_size": batched / num_batches if num_batches else 0.0,
+                "requests": self._requests,
+                "errors": self._errors,
+                "decode_seconds": self._decode_seconds,
+                "uptime_seconds": time.time() - self._started}
+
+    async def decode(self, model_name, observations):
+        """Queues one sequence for model_name and waits for its (path, score)"""
+        if model_name not in self._models:
+            raise KeyError("Unknown model: " + str(model_name))
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[model_name]
+        queue.append((observations, future))
+
+        if len(queue) >= self._max_batch_size:
+            self._batch_ready[model_name].set()
+        if model_name not in self._flushers:
+            self._flushers[model_name] = asyncio.create_task(self._flush(model_name))
+
+        return await future
+
+    async def _flush(self, model_name):
+        """ Waits for a full batch or max_wait, then decodes batches until the queue is empty """
+        ready = self._batch_ready[model_name]
+        queue = self._queues[model_name]
+        try:
+            while queue:
+                try:
+                    await asyncio.wait_for(ready.wait(), self._max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+                # Requests keep queueing while every slot is busy, _run_batch releases it
+                await self._slots.acquire()
+                batch = queue[:self._max_batch_size]
+                del queue[:self._max_batch_size]
+                if len(queue) < self._max_batch_size:
+                    ready.clear()
+
+                task = asyncio.create_task(self._run_batch(model_name, batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+        finally:
+            del self._flushers[model_name]
+
+    async def _run_batch(self, model_name, batch):
+        """ Decodes one batch in the executor and resolves its futures """
+        self._batch_sizes[len(batch)] += 1
+        self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _decode_batch, self._models[model_name],
+                [(i, observations) for i, (observations, _) in enumerate(batch)])
+        except Exception as error:
+            results = [(i, None, None, f"{type(error).__name__}: {error}") for i in range(len(batch))]
+        finally:
+            self._in_flight -= 1
+            self._decode_seconds += time.perf_counter() - start
+            self._slots.release()
+
+        for (_, future), (_, path, score, error) in zip(batch, results):
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(ValueError(error))
+            else:
+                future.set_result((path, score))
+
+    async def handle_connection(self, reader, writer):
+        """ Serves JSON line requests from one client until it disconnects """
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Line over the stream limit, the connection cannot be resynchronized
+                    writer.write(json.dumps({"error": "Request line too long"}).encode() + b"\n")
+                    break
+
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+
+                task = asyncio.create_task(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer):
+        """ Handles one request line and writes its response """
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("op") == "metrics":
+                response = {"id": request_id, "metrics": self.metrics()}
+            else:
+                self._requests += 1
+                path, score = await self.decode(request["model"], request["observations"])
+                response = {"id": request_id, "path": path, "score": score}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            self._errors += 1
+            response = {"id": request_id, "error": f"{type(error).__name__}: {error}"}
+
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def serve(self, unix_path=None, host="127.0.0.1", port=8765):
+        """Serves forever on a Unix socket when unix_path is given, otherwise on TCP"""
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path, limit=LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port, limit=LINE_LIMIT)
+
+        async with server:
+            await server.serve_forever()
+
+def _decode_batch(model_path, records):
+    """ Executor task, models are loaded once per process through the model cache """
+    return decode_chunk(cached_load_model(model_path), records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves Viterbi decoding over JSON lines with per model micro-batching")
+    parser.add_argument("--model", action="append", required=True, metavar="NAME=PATH",
+                        help="Model file written by model_io.save_model, repeat for more models")
+    parser.add_argument("--unix", help="Unix socket path, instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Time the first request of a batch waits for more")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--workers", type=int, help="Executor size, defaults to the cpu count")
+    parser.add_argument("--max-in-flight", type=int, help="Most batches decoding at once, defaults to the executor size")
+    args = parser.parse_args(argv)
+
+    models = dict()
+    for entry in args.model:
+        name, separator, path = entry.partition("=")
+        if not separator:
+            parser.error("--model must be NAME=PATH: " + entry)
+        models[name] = os.path.abspath(path)
+
+    workers = args.workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if args.executor == "process" else ThreadPoolExecutor(max_workers=workers)
+
+    async def run():
+        server = DecodeServer(models,
+                              max_batch_size=args.max_batch_size,
+                              max_wait=args.max_wait_ms / 1000,
+                              executor=executor,
+                              max_in_flight=args.max_in_flight or workers)
+        await server.serve(unix_path=args.unix, host=args.host, port=args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import contextlib
+import time
+
+# Shared do-nothing context, returned when instrumentation is disabled
+_NO_PHASE = contextlib.nullcontext()
+
+class DecodeStats(object):
+    """Per phase timers, counters and working memory collected by a decoder
+
+    Phases:
+        "log_conversion": taking the log of the matrices and casting them to the model dtype
+        "encode": mapping observations to indices
+        "forward": emission gather and forward recursion
+        "backtrack": final argmax and traceback, including checkpoint recomputation
+        "labels": converting the state path to the state space
+
+    Counters:
+        "sequences", "steps" and "state_steps" (states x steps processed)
+
+    Every callback is called as callback(event, name, value), with event one
+    of "phase" (seconds), "count" (increment) or "bytes" (working matrix bytes),
+    so the measurements can be forwarded to a metrics system as they happen.
+    """
+
+    def __init__(self, callback=None):
+        """ Intialize Local Variables """
+        self.phase_seconds = dict()
+        self.counters = dict()
+        self.bytes_allocated = 0
+        self.peak_bytes_allocated = 0
+        self._callbacks = [] if callback is None else [callback]
+        return
+
+    def add_callback(self, callback):
+        """Registers another callback(event, name, value)"""
+        self._callbacks.append(callback)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Adds the wall time of the with block to phase name"""
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + elapsed
+            self._emit("phase", name, elapsed)
+
+    def count(self, name, value=1):
+        """Adds value to counter name"""
+        self.counters[name] = self.counters.get(name, 0) + value
+        self._emit("count", name, value)
+
+    def record_bytes(self, num_bytes):
+        """Records the working matrix bytes of the last decode"""
+        self.bytes_allocated = int(num_bytes)
+        self.peak_bytes_allocated = max(self.peak_bytes_allocated, self.bytes_allocated)
+        self._emit("bytes", "working_matrices", self.bytes_allocated)
+
+    def reset(self):
+        """Clears every timer and counter, callbacks are kept"""
+        self.phase_seconds.clear()
+        self.counters.clear()
+        self.bytes_allocated = 0
+        self.peak_bytes_allocated = 0
+
+    def as_dict(self):
+        """Plain dict of the measurements, for logging or JSON"""
+        return {"phase_seconds": dict(self.phase_seconds),
+                "counters": dict(self.counters),
+                "bytes_allocated": self.bytes_allocated,
+                "peak_bytes_allocated": self.peak_bytes_allocated}
+
+    def _emit(self, event, name, value):
+        for callback in self._callbacks:
+            callback(event, name, value)
+
+def phase(stats, name):
+    """Times phase name on stats, or does nothing when stats is None"""
+    if stats is None:
+        return _NO_PHASE
+    return stats.phase(name)
+
+if __name__ == "__main__":
+    print(__file__)
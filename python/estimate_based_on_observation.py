@@ -22,7 +22,8 @@
 # THE SOFTWARE. 
 import os
 import numpy as np
-import ViterbiAlgorithm
+import HiddenMarkovModel
+from observation_encoding import ObservationEncoder
 from tabulate import tabulate
 from generate_observations import generate_observations
 
@@ -72,63 +73,106 @@ def pretty_print(initial_state_probability, transition_matrix, emission_matrix,
 
     return
 
-def updateMatricesAfterRun(calculated_states, observations, state_space, observation_space):
-    """ Updates Transition and Emission Matrices based on observations """
+class SufficientStatistics(object):
+    """Transition and emission counts accumulated from int coded state paths
+
+    Counts are added with bincount over ravel_multi_index, so any number of
+    sequences or chunks can be folded in one at a time without joining them.
+    """
+
+    def __init__(self, num_states, num_observations):
+        """ Intialize Counts """
+        self._num_states = num_states
+        self._num_observations = num_observations
+        self.transition_counts = np.zeros((num_states, num_states))
+        self.emission_counts = np.zeros((num_states, num_observations))
+        self._last_state = None
+        return
 
-    # Create New Transition Matrix
-    num_states = len(state_space)
+    def update(self, states, observations, continues=False):
+        """Adds the counts of one sequence, or of the next chunk of one when continues is set"""
+        states = np.asarray(states)
+        observations = np.asarray(observations)
 
-    # Setup Index Lookup for States
-    state_to_index = dict()
-    for i in range(len(state_space)):
-        state_to_index[state_space[i]] = i
+        if len(states) == 0:
+            return
 
-    # Init Transition Matrix
-    transitionMatrix = np.zeros((num_states,num_states))
-    for i in range(1, len(calculated_states)):
-        transitionMatrix[state_to_index[calculated_states[i-1]]][state_to_index[calculated_states[i]]] += 1
+        # Transition across the chunk boundary
+        if continues and self._last_state is not None:
+            self.transition_counts[self._last_state, states[0]] += 1
 
-    for i in range(len(transitionMatrix)):
-        transitionMatrix[i] /= np.sum(transitionMatrix[i])
+        transitions = np.ravel_multi_index((states[:-1], states[1:]), (self._num_states, self._num_states))
+        self.transition_counts += np.bincount(transitions, minlength=self._num_states**2) \
+                                    .reshape(self._num_states, self._num_states)
 
-    # Create New Emissions Matrix
-    num_observations = len(observation_space)
+        emissions = np.ravel_multi_index((states, observations), (self._num_states, self._num_observations))
+        self.emission_counts += np.bincount(emissions, minlength=self._num_states*self._num_observations) \
+                                  .reshape(self._num_states, self._num_observations)
 
-    # Setup Index Lookup for Observations
-    obs_to_index = dict()
-    for i in range(len(observation_space)):
-        obs_to_index[observation_space[i]] = i
+        self._last_state = states[-1]
+        return
 
-    emissionMatrix = np.zeros((num_states, num_observations))
-    for i in range(len(observations)):
-        emissionMatrix[state_to_index[calculated_states[i]]][obs_to_index[observations[i]]] += 1
+    def normalize(self, previous_transition_matrix=None, previous_emission_matrix=None):
+        """Returns row normalized transition and emission matrices
 
-    for i in range(len(emissionMatrix)):
-        emissionMatrix[i] /= np.sum(emissionMatrix[i])
+        Rows without any counts keep the previous estimate when one is given,
+        otherwise they become uniform.
+        """
+        return _normalize_rows(self.transition_counts, previous_transition_matrix), \
+               _normalize_rows(self.emission_counts, previous_emission_matrix)
 
-    return transitionMatrix, emissionMatrix
+def _normalize_rows(counts, previous=None):
+    """ Divides each row by its sum, replacing empty rows instead of dividing 0 by 0 """
+    totals = counts.sum(axis=1, keepdims=True)
+    empty = totals[:, 0] == 0
+
+    matrix = counts / np.where(empty[:, None], 1, totals)
+    if np.any(empty):
+        matrix[empty] = 1.0 / counts.shape[1] if previous is None else np.asarray(previous, dtype=float)[empty]
+
+    return matrix
+
+def updateMatricesAfterRun(calculated_states, observations, state_space, observation_space):
+    """ Updates Transition and Emission Matrices based on observations """
+
+    # Replace states and observations with indices
+    states = ObservationEncoder(state_space).encode(calculated_states)
+    observed = ObservationEncoder(observation_space).encode(observations)
+
+    statistics = SufficientStatistics(len(state_space), len(observation_space))
+    statistics.update(states, observed)
+
+    return statistics.normalize()
 
 def runLoop(initial_state_probability, transition_matrix, emission_matrix, observations, state_space, observation_space, runs=100):
     # Execute Viterbi Algorithm and recalculate transition and emission matrices
 
     previous_probability = 0
+    observed = None
     for i in range(runs):
-        v = ViterbiAlgorithm.ViterbiAlgorithm(transition_matrix, emission_matrix, initial_state_probability, 
-                                              observations, 
-                                              state_space=state_space, 
-                                              observation_space=observation_space,
-                                              use_log_probabilities=True)
-        v.run()
-
-        print("Run " + str(i+1) + " Probability: " + str(v.viterbi_probability))
+        model = HiddenMarkovModel.HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                                    state_space=state_space,
+                                                    observation_space=observation_space,
+                                                    use_log_probabilities=True)
+
+        # Observations do not change between runs, so only encode them once
+        if observed is None:
+            observed = model.encode(observations)
+
+        viterbi_path, viterbi_probability = model.decode_indices(observed, memory_mode="low")
+
+        print("Run " + str(i+1) + " Probability: " + str(viterbi_probability))
         
-        if (abs(previous_probability-v.viterbi_probability) < 1e-6):
+        if (abs(previous_probability-viterbi_probability) < 1e-6):
             print("Converged after " + str(i+1) + " Runs")
             break
 
-        previous_probability = v.viterbi_probability
+        previous_probability = viterbi_probability
 
-        transition_matrix, emission_matrix = updateMatricesAfterRun(v.viterbi_path, observations, state_space, observation_space)
+        # Re-estimate directly from the int coded path
+        statistics = SufficientStatistics(len(state_space), len(observation_space))
+        statistics.update(viterbi_path, observed)
+        transition_matrix, emission_matrix = statistics.normalize(transition_matrix, emission_matrix)
 
     return transition_matrix, emission_matrix
 
@@ -20,6 +20,10 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE. 
+import bisect
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import numpy as np
 
 
@@ -49,7 +53,126 @@ def _check_input(initial_state_probability, transition_matrix, emission_matrix,
 
     return True
 
-def generate_observations(initial_state_probability, transition_matrix, emission_matrix, num_samples=300, state_space=None, observation_space=None, seed=None):
+class ObservationSampler(object):
+    """A vectorized sampler for a Hidden Markov Model
+
+    Cumulative initial, transition and emission tables are built once. Each
+    call draws all of its uniforms in bulk from a numpy.random.Generator and
+    never touches the global np.random state, so samplers are safe to use
+    from concurrent code as long as each caller owns its Generator.
+    """
+
+    # Largest model whose transition table is also kept as Python lists for bisect
+    LIST_MAX_STATES = 1024
+
+    # Steps of the chain walked per block of Python floats, also bounds the emission lookup block
+    CHAIN_BLOCK_SIZE = 1 << 16
+
+    def __init__(self, initial_state_probability, transition_matrix, emission_matrix, state_space=None, observation_space=None):
+        """ Intialize Cumulative Tables """
+
+        if state_space is None:
+            state_space = [i for i in range(len(initial_state_probability))]
+
+        if observation_space is None:
+            observation_space = [i for i in range(len(emission_matrix[0]))]
+
+        self._state_space = state_space
+        self._observation_space = observation_space
+        self._num_states = len(state_space)
+        self._num_observations = len(observation_space)
+
+        if not _check_input(initial_state_probability, transition_matrix, emission_matrix, self._num_states, self._num_observations):
+            raise ValueError("Inconsistent model dimensions")
+
+        self._initial_cdf = _cumulative(np.array(initial_state_probability, dtype=float))
+        self._transition_cdf = _cumulative(np.array(transition_matrix, dtype=float))
+        self._emission_cdf = _cumulative(np.array(emission_matrix, dtype=float))
+
+        # bisect over lists is the fastest per step lookup, the lists cost about 32 bytes per entry
+        self._transition_rows = self._transition_cdf.tolist() if self._num_states <= self.LIST_MAX_STATES else None
+        return
+
+    def sample(self, num_samples, rng=None, as_labels=False):
+        """Samples a state sequence and its observations
+
+        Args:
+            num_samples (int): Number of observations to observe
+            rng (numpy.random.Generator or int): Generator, or seed for a new one
+            as_labels (bool): Convert indices to the state and observation spaces
+
+        Returns:
+            states (ndarray or list): The true states during observation
+            observations (ndarray or list): The observation at each state
+
+        """
+        rng = np.random.default_rng(rng)
+
+        # Draw every uniform up front
+        state_uniforms = rng.random(num_samples)
+        observation_uniforms = rng.random(num_samples)
+
+        states = self._sample_states(state_uniforms)
+        observations = self._sample_observations(states, observation_uniforms)
+
+        if as_labels:
+            return [self._state_space[i] for i in states], [self._observation_space[i] for i in observations]
+
+        return states, observations
+
+    def _sample_states(self, uniforms):
+        """Turns one uniform per step into a Markov chain of state indices
+
+        Each step depends on the one before, so this walks the chain with one
+        binary search per step over the precomputed cumulative rows. The cost
+        is O(T log N), with no per step work proportional to N.
+        """
+        num_samples = len(uniforms)
+        if num_samples == 0:
+            return np.empty(0, dtype=np.intp)
+
+        states = np.empty(num_samples, dtype=np.intp)
+        state = int(np.searchsorted(self._initial_cdf, uniforms[0], side="right"))
+        states[0] = state
+
+        # Walk the chain a block at a time, so only one block lives as Python objects
+        rows = self._transition_rows
+        for start in range(1, num_samples, self.CHAIN_BLOCK_SIZE):
+            block = uniforms[start:start + self.CHAIN_BLOCK_SIZE].tolist()
+            if rows is not None:
+                for t, uniform in enumerate(block):
+                    state = bisect.bisect_right(rows[state], uniform)
+                    block[t] = state
+            else:
+                for t, uniform in enumerate(block):
+                    state = int(np.searchsorted(self._transition_cdf[state], uniform, side="right"))
+                    block[t] = state
+            states[start:start + len(block)] = block
+
+        return states
+
+    def _sample_observations(self, states, uniforms):
+        """Samples the observation of every step from its state's cumulative row
+
+        searchsorted(cdf, u, side="right") is the count of cdf entries <= u,
+        so whole blocks of steps are looked up at once, without a pass per state.
+        """
+        observations = np.empty(len(states), dtype=np.intp)
+        block_size = max(1, self.CHAIN_BLOCK_SIZE // self._num_observations)
+        for start in range(0, len(states), block_size):
+            stop = min(start + block_size, len(states))
+            rows = self._emission_cdf[states[start:stop]]
+            observations[start:stop] = np.count_nonzero(rows <= uniforms[start:stop, None], axis=1)
+
+        return observations
+
+def _cumulative(probabilities):
+    """Cumulative sums along the last axis, with the final entry pinned to one"""
+    cdf = np.cumsum(probabilities, axis=-1)
+    cdf[..., -1] = 1.0
+    return cdf
+
+def generate_observations(initial_state_probability, transition_matrix, emission_matrix, num_samples=300, state_space=None, observation_space=None, seed=None, return_indices=False):
     """Generates an observation and associated ground truth
 
     Loaded Die Example:
@@ -72,55 +195,135 @@ def generate_observations(initial_state_probability, transition_matrix, emission
         num_samples (int): Number of observations to observe
         state_space (list): States representation
         observation_space (list): Observation representation
-        seed (int): seed used in random function
+        seed (int or numpy.random.Generator): seed used in random function
+        return_indices (bool): Return int coded arrays instead of labels
 
     Returns:
-        states (list): The true states during observation
-        observations (list): The observation at each state
+        states (list or ndarray): The true states during observation
+        observations (list or ndarray): The observation at each state
 
     """
-    if state_space == None:
-        state_space = [i for i in range(len(initial_state_probability))]
-
-    if observation_space == None:
-        observation_space = [i for i in range(len(emission_matrix[0]))]
-
-    num_states = len(state_space)
-    num_observations = len(observation_space)
-
-    if not _check_input(initial_state_probability, transition_matrix, emission_matrix, num_states, num_observations):
+    try:
+        sampler = ObservationSampler(initial_state_probability, transition_matrix, emission_matrix,
+                                     state_space=state_space,
+                                     observation_space=observation_space)
+    except ValueError:
         return None, None
 
-    # Set Seed if one exists
-    np.random.seed(seed)
+    return sampler.sample(num_samples, rng=seed, as_labels=not return_indices)
 
-    # Setup Index Lookup for States
-    state_to_index = dict()
-    for i in range(len(state_space)):
-        state_to_index[state_space[i]] = i
-    
-    # Setup Index Lookup for Observations
-    obs_to_index = dict()
-    for i in range(len(observation_space)):
-        obs_to_index[observation_space[i]] = i
+def generate_many_observations(initial_state_probability, transition_matrix, emission_matrix, num_sequences, num_samples=300, seed=None, workers=None, out_dir=None):
+    """Generates many independent observation sequences across a process pool
 
-    # Find Initial State
-    state = np.random.choice(state_space, 1, p=initial_state_probability)[0]
-    observation = np.random.choice(observation_space, 1, p=emission_matrix[state_to_index[state]])[0]
+    Sequence i is always sampled from the i-th child of SeedSequence(seed), so
+    the result for a given seed does not depend on the number of workers.
+    Workers write straight into shared or memory-mapped int arrays instead of
+    returning their samples to the parent.
 
-    # Initialize Returns
-    states_return = [state]
-    obs_return = [observation]
-
-    # Generate the Observations
-    for _ in range(num_samples-1):
-        state = np.random.choice(state_space, 1, p=transition_matrix[state_to_index[state]])[0]
-        observation = np.random.choice(observation_space, 1, p=emission_matrix[state_to_index[state]])[0]
+    Args:
+        initial_state_probability (1xn float list): Probability that state n is the first state
+        transition_matrix (nxn float list): Probability that state n+1 is selected after state n
+        emission_matrix (nxo float list): Probability that observation o is observed in state n
+        num_sequences (int): Number of sequences to generate
+        num_samples (int): Number of observations in each sequence
+        seed (int): seed used to spawn one generator per sequence
+        workers (int): Number of processes, defaults to the cpu count
+        out_dir (str): Write states.npy and observations.npy here as memory maps
 
-        states_return.append(state)
-        obs_return.append(observation)
+    Returns:
+        states (num_sequences x num_samples ndarray): State index of each step
+        observations (num_sequences x num_samples ndarray): Observation index of each step
 
-    return states_return, obs_return
+    """
+    # Validate once in the parent, before any process starts
+    ObservationSampler(initial_state_probability, transition_matrix, emission_matrix)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    shape = (num_sequences, num_samples)
+    dtypes = (np.min_scalar_type(len(initial_state_probability) - 1),
+              np.min_scalar_type(len(emission_matrix[0]) - 1))
+
+    # Preallocate the outputs, workers attach to them by name or path
+    shared = []
+    if out_dir is not None:
+        targets = [os.path.join(out_dir, "states.npy"), os.path.join(out_dir, "observations.npy")]
+        for target, dtype in zip(targets, dtypes):
+            np.lib.format.open_memmap(target, mode="w+", dtype=dtype, shape=shape).flush()
+    else:
+        targets = []
+        for dtype in dtypes:
+            block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+            shared.append(block)
+            targets.append(block.name)
+
+    model = (initial_state_probability, transition_matrix, emission_matrix)
+    seeds = np.random.SeedSequence(seed).spawn(num_sequences)
+    chunk = max(-(-num_sequences // (workers * 4)), 1)
+    tasks = [(start, seeds[start:start+chunk]) for start in range(0, num_sequences, chunk)]
+
+    try:
+        if workers == 1:
+            _init_worker(model, num_samples, targets, dtypes, shape)
+            for task in tasks:
+                _generate_task(task)
+            _close_worker()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(model, num_samples, targets, dtypes, shape)) as pool:
+                for _ in pool.map(_generate_task, tasks):
+                    pass
+
+        if out_dir is not None:
+            return tuple(np.load(target, mmap_mode="r+") for target in targets)
+
+        return tuple(np.ndarray(shape, dtype=dtype, buffer=block.buf).copy() for block, dtype in zip(shared, dtypes))
+    finally:
+        for block in shared:
+            block.close()
+            block.unlink()
+
+# Per process state for generate_many_observations
+_worker = dict()
+
+def _init_worker(model, num_samples, targets, dtypes, shape):
+    """ Builds the sampler and attaches the output arrays once per process """
+    _worker["sampler"] = ObservationSampler(*model)
+    _worker["num_samples"] = num_samples
+    _worker["shared"] = []
+    _worker["outputs"] = []
+
+    for target, dtype in zip(targets, dtypes):
+        if target.endswith(".npy"):
+            _worker["outputs"].append(np.load(target, mmap_mode="r+"))
+        else:
+            block = shared_memory.SharedMemory(name=target)
+            _worker["shared"].append(block)
+            _worker["outputs"].append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+def _close_worker():
+    """ Detaches the output arrays of the in-process worker """
+    _worker["outputs"] = []
+    for block in _worker["shared"]:
+        block.close()
+    _worker["shared"] = []
+
+def _generate_task(task):
+    """ Samples a contiguous range of sequences into the outputs """
+    start, seeds = task
+    states_out, observations_out = _worker["outputs"]
+
+    for i, seed in enumerate(seeds):
+        states, observations = _worker["sampler"].sample(_worker["num_samples"], rng=np.random.default_rng(seed))
+        states_out[start + i] = states
+        observations_out[start + i] = observations
+
+    for output in _worker["outputs"]:
+        if isinstance(output, np.memmap):
+            output.flush()
+
+    return len(seeds)
 
 def print_result(observed, actual, max_length=60):
     ''' Pretty Prints the Output '''
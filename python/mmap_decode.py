@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import tempfile
+import numpy as np
+import viterbi_engine
+from decode_stats import phase
+
+# Observations read, encoded and decoded per block
+BLOCK_SIZE = 65536
+
+def open_observations(path, raw_dtype=np.uint8):
+    """Memory-maps an observation file read-only
+
+    .npy files keep their own dtype and must be one dimensional, any other
+    file is read as a flat array of raw_dtype (by default one byte per observation).
+    """
+    if path.endswith(".npy"):
+        observations = np.load(path, mmap_mode="r")
+        if observations.ndim != 1:
+            raise ValueError("Observation file must hold a one dimensional array: " + path)
+        return observations
+
+    return np.memmap(path, dtype=raw_dtype, mode="r")
+
+def decode_file(model, input_path, output_path, raw_dtype=np.uint8, block_size=BLOCK_SIZE, work_dir=None):
+    """Decodes an on-disk observation file into an on-disk state path
+
+    The forward pass streams through the memory-mapped observations one block
+    at a time, writing the backpointers to a temporary memory-mapped file in
+    the smallest dtype that holds a state index. The backtrack then reads them
+    back block by block, last block first, and writes the path into output_path.
+    Only a few blocks are ever resident, so memory does not grow with the file.
+
+    Integer files are taken as observation indices. Raw byte files are instead
+    decoded through the model's observation space when it is a single
+    character alphabet (for example '1'..'6'), and .npy files of strings
+    always go through the observation space.
+
+    Args:
+        model (HiddenMarkovModel): Compiled model
+        input_path (str): .npy file of index coded observations, or a raw file
+        output_path (str): Path file to create, .npy or raw
+        raw_dtype (dtype): Element type of raw input files
+        block_size (int): Observations per block
+        work_dir (str): Directory of the temporary backpointer file, defaults to the output directory
+
+    Returns:
+        path (memmap): The state index path, as written to output_path
+        probability (float): The probability of that path
+
+    """
+    observations = open_observations(input_path, raw_dtype)
+    num_observations = len(observations)
+    if num_observations == 0:
+        raise ValueError("Cannot decode an empty observation file: " + input_path)
+
+    num_states = model.num_states
+    dtype = viterbi_engine.backtrack_dtype(num_states)
+    encode_bytes = not input_path.endswith(".npy") and model._encoder._byte_lookup is not None
+
+    def read_block(start, stop):
+        block = np.asarray(observations[start:stop])
+        if encode_bytes:
+            return model.encode(block.tobytes())
+        if block.dtype.kind in "iu":
+            return block
+        return model.encode(block)
+
+    if model.stats is not None:
+        model.stats.count("sequences")
+        model.stats.count("steps", num_observations)
+        model.stats.count("state_steps", num_observations * num_states)
+
+    if work_dir is None:
+        work_dir = os.path.dirname(os.path.abspath(output_path))
+
+    with tempfile.TemporaryFile(dir=work_dir) as backtrack_file:
+        backtrack = np.memmap(backtrack_file, dtype=dtype, mode="w+", shape=(max(num_observations - 1, 1), num_states))
+
+        with phase(model.stats, "forward"):
+            scale = model._new_scale()
+            column = model.first_column(read_block(0, 1)[0])
+            if scale is not None:
+                viterbi_engine.rescale(column, model.use_log_probabilities, scale)
+
+            for start in range(1, num_observations, block_size):
+                stop = min(start + block_size, num_observations)
+                column = viterbi_engine.forward_pass(model._transition_matrix_a,
+                                                     model._emission_rows[read_block(start, stop)], column,
+                                                     model.use_log_probabilities,
+                                                     backtrack=backtrack[start-1:stop-1],
+                                                     product=model._product,
+                                                     scale=scale)
+
+        # Set last entry to most likely state
+        last_state = int(np.argmax(column))
+
+        if output_path.endswith(".npy"):
+            path = np.lib.format.open_memmap(output_path, mode="w+", dtype=dtype, shape=(num_observations,))
+        else:
+            path = np.memmap(output_path, dtype=dtype, mode="w+", shape=(num_observations,))
+
+        # Backtrack one block at a time, last block first
+        with phase(model.stats, "backtrack"):
+            state = last_state
+            segment_path = np.zeros(min(block_size, num_observations - 1) + 1, dtype=int)
+            for stop in range(num_observations - 1, 0, -block_size):
+                start = max(stop - block_size, 0)
+                segment = np.asarray(backtrack[start:stop])
+                viterbi_engine.backtrack_path(segment, state, path=segment_path[:stop-start+1])
+                path[start:stop+1] = segment_path[:stop-start+1]
+                state = int(segment_path[0])
+
+            if num_observations == 1:
+                path[0] = last_state
+
+        path.flush()
+        del backtrack
+
+    # Resident per block: encoded observations, their emission columns and a copy of the backpointers
+    block_rows = min(block_size, num_observations)
+    model._record_memory(column, model._product, segment_path,
+                         ((block_rows,), np.intp),
+                         ((block_rows, num_states), model.dtype),
+                         ((block_rows, num_states), dtype))
+
+    return path, model._probability(column[last_state], scale)
+
+if __name__ == "__main__":
+    print(__file__)
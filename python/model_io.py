@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import HiddenMarkovModel
+import sparse_transitions
+
+# Bumped when the layout of the saved arrays changes
+FORMAT_VERSION = 1
+
+def save_model(file, model):
+    """Saves a compiled HiddenMarkovModel as an .npz archive
+
+    The arrays are stored in the model's decoding domain (log probabilities
+    in log mode) and precision, so loading skips the eps and log step. The
+    state and observation spaces are stored as JSON, so no pickling is needed.
+
+    Args:
+        file (str or file): Destination, numpy appends .npz to paths without it
+        model (HiddenMarkovModel): Model to save
+
+    """
+    transitions = model._transition_matrix_a
+    arrays = dict()
+    if isinstance(transitions, sparse_transitions.SparseTransitions):
+        arrays["transition_sources"] = transitions._sources
+        arrays["transition_destinations"] = transitions._destinations
+        arrays["transition_values"] = transitions._values
+        arrays["transition_fill"] = np.array(transitions._fill)
+    else:
+        arrays["transition"] = transitions
+
+    header = {"version": FORMAT_VERSION,
+              "num_states": model.num_states,
+              "use_log_probabilities": model.use_log_probabilities,
+              "dtype": model.dtype.name,
+              "state_space": model._state_space,
+              "observation_space": model._encoder._observation_space}
+
+    np.savez(file,
+             header=np.array(json.dumps(header)),
+             emission=model._emission_matrix_b,
+             initial=model._initial_state_array_i,
+             **arrays)
+
+def save_matrices(file, initial_state_probability, transition_matrix, emission_matrix, state_space=None, observation_space=None, use_log_probabilities=True):
+    """Saves plain probability matrices, such as those returned by runLoop, as a model file"""
+    save_model(file, HiddenMarkovModel.HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                                          state_space=state_space,
+                                                          observation_space=observation_space,
+                                                          use_log_probabilities=use_log_probabilities))
+
+def load_model(file, stats=None):
+    """Loads a model written by save_model
+
+    Args:
+        file (str, bytes or file): Path, raw archive bytes or an open file
+        stats (DecodeStats): Optional instrumentation for the loaded model
+
+    Returns:
+        model (HiddenMarkovModel): The compiled model
+
+    """
+    if isinstance(file, (bytes, bytearray)):
+        file = io.BytesIO(file)
+
+    with np.load(file, allow_pickle=False) as archive:
+        header = json.loads(archive["header"].item())
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError("Unsupported model file version: " + str(header["version"]))
+
+        if "transition" in archive:
+            transitions = archive["transition"]
+        else:
+            transitions = sparse_transitions.SparseTransitions(header["num_states"],
+                                                               archive["transition_sources"],
+                                                               archive["transition_destinations"],
+                                                               archive["transition_values"],
+                                                               fill=archive["transition_fill"].item(),
+                                                               dtype=header["dtype"])
+
+        return HiddenMarkovModel.HiddenMarkovModel(transitions, archive["emission"], archive["initial"],
+                                                   state_space=header["state_space"],
+                                                   observation_space=header["observation_space"],
+                                                   use_log_probabilities=header["use_log_probabilities"],
+                                                   dtype=header["dtype"],
+                                                   log_space_input=header["use_log_probabilities"],
+                                                   stats=stats)
+
+class ModelCache(object):
+    """Size bounded LRU cache of loaded models, keyed by the SHA-256 of the file contents
+
+    Each path remembers the stat stamp (inode, size, modification and change
+    time) and key of its last read, so a hit costs one stat call. Any other
+    stamp reads and hashes the file again. Tools such as cp -p and rsync -a
+    can restore the modification time but not the change time, so a rewrite
+    is only missed when it keeps the inode and size and lands within the
+    filesystem's timestamp resolution of the last read. Loads are serialized
+    by a lock, so the cache can be shared by threads. The returned models
+    keep their scratch buffers per thread, so threads can decode with the
+    same model at once (see HiddenMarkovModel).
+    """
+
+    def __init__(self, max_models=128):
+        """ Intialize Local Variables """
+        if max_models < 1:
+            raise ValueError("max_models must be at least 1")
+
+        self._max_models = max_models
+        self._models = OrderedDict()
+        self._stamps = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, path):
+        """Returns the model stored at path, loading it on a miss"""
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        stamp = (info.st_ino, info.st_size, info.st_mtime_ns, info.st_ctime_ns)
+
+        # Same file as last time, skip reading and hashing it
+        with self._lock:
+            last_stamp, key = self._stamps.get(path, (None, None))
+            if last_stamp == stamp and key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        key = hashlib.sha256(data).hexdigest()
+        model = self._lookup(key, data)
+
+        # One entry per path, replaced whenever the stamp changes
+        with self._lock:
+            if key in self._models:
+                self._stamps[path] = (stamp, key)
+
+        return model
+
+    def get_bytes(self, data):
+        """Returns the model held in raw archive bytes, loading it on a miss"""
+        return self._lookup(hashlib.sha256(data).hexdigest(), data)
+
+    def _lookup(self, key, data):
+        """ Cached model for key, loaded from data on a miss """
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+
+            self.misses += 1
+            model = load_model(data)
+            self._models[key] = model
+            if len(self._models) > self._max_models:
+                evicted, _ = self._models.popitem(last=False)
+                self._stamps = {path: entry for path, entry in self._stamps.items() if entry[1] != evicted}
+
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._stamps.clear()
+
+# Process wide cache used by cached_load_model
+_cache = ModelCache()
+
+def cached_load_model(path):
+    """Loads path through the process wide ModelCache"""
+    return _cache.get(path)
+
+if __name__ == "__main__":
+    print(__file__)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+
+class ObservationEncoder(object):
+    """Maps observations to their index in an observation space
+
+    Three paths are used, fastest first:
+        Integer ndarrays are already indices when there is no space (or the space is 0..M-1) and are returned without a copy
+        Single character str/bytes spaces go through a 256 entry lookup table over np.frombuffer
+        Any other sortable space goes through np.unique and searchsorted
+    """
+
+    def __init__(self, observation_space=None):
+        """ Intialize Lookup Tables """
+
+        self._observation_space = observation_space
+        self._identity = observation_space is None or \
+            all(isinstance(obs, (int, np.integer)) and obs == i for i, obs in enumerate(observation_space))
+
+        # Setup Index Lookup for Observations, used when nothing faster applies
+        self._obs_to_index = dict()
+        if observation_space is not None:
+            for i in range(len(observation_space)):
+                self._obs_to_index[observation_space[i]] = i
+
+        # 256 entry table for single character alphabets, -1 marks unknown symbols
+        self._byte_lookup = None
+        if observation_space is not None and all(_byte_code(obs) is not None for obs in observation_space):
+            self._byte_lookup = np.full(256, -1, dtype=np.intp)
+            for i in range(len(observation_space)):
+                self._byte_lookup[_byte_code(observation_space[i])] = i
+
+        # Sorted unique symbols and their index in the space, last occurrence wins like the dict
+        self._sorted_space = None
+        self._sorted_index = None
+        if observation_space is not None and not self._identity:
+            values = np.asarray(observation_space)
+            if values.ndim == 1 and values.dtype.kind in "biufSU" and values.tolist() == list(observation_space):
+                self._sorted_space, last = np.unique(values[::-1], return_index=True)
+                self._sorted_index = len(values) - 1 - last
+
+        return
+
+    def encode(self, observations):
+        """Returns observations as an index array"""
+
+        # Already index coded
+        if isinstance(observations, np.ndarray) and observations.dtype.kind in "iu" and self._identity:
+            return observations
+
+        # Generators and other one-shot iterables are read once by every path below
+        if not hasattr(observations, "__len__"):
+            observations = list(observations)
+
+        if self._observation_space is None:
+            return np.asarray(observations)
+
+        if self._byte_lookup is not None:
+            encoded = self._encode_bytes(observations)
+            if encoded is not None:
+                return encoded
+
+        if self._sorted_space is not None:
+            encoded = self._encode_sorted(observations)
+            if encoded is not None:
+                return encoded
+
+        return np.array([self._obs_to_index[obs] for obs in observations], dtype=np.intp)
+
+    def _encode_bytes(self, observations):
+        """Lookup table path, None when observations are not single characters"""
+        if isinstance(observations, np.ndarray) and observations.dtype.kind in "SU":
+            observations = observations.tolist()
+
+        if isinstance(observations, str):
+            data = observations
+        elif isinstance(observations, (bytes, bytearray, memoryview)):
+            data = bytes(observations)
+        else:
+            try:
+                data = "".join(observations)
+            except TypeError:
+                return None
+
+            # Only a join of single characters keeps one character per observation
+            if len(data) != len(observations):
+                return None
+
+        if isinstance(data, str):
+            try:
+                data = data.encode("latin-1")
+            except UnicodeEncodeError:
+                return None
+
+        encoded = self._byte_lookup[np.frombuffer(data, dtype=np.uint8)]
+        if np.any(encoded < 0):
+            raise KeyError(bytes([data[int(np.argmax(encoded < 0))]]).decode("latin-1"))
+
+        return encoded
+
+    def _encode_sorted(self, observations):
+        """np.unique / searchsorted path, None when observations cannot be compared with the space"""
+        try:
+            values = np.asarray(observations)
+            position = np.searchsorted(self._sorted_space, values)
+        except TypeError:
+            return None
+
+        position = np.minimum(position, len(self._sorted_space) - 1)
+        found = self._sorted_space[position] == values
+        if not np.all(found):
+            raise KeyError(values[np.argmin(found)].item())
+
+        return self._sorted_index[position]
+
+def _byte_code(obs):
+    """Byte value of a single character str or bytes symbol, else None"""
+    if isinstance(obs, str) and len(obs) == 1 and ord(obs) < 256:
+        return ord(obs)
+    if isinstance(obs, bytes) and len(obs) == 1:
+        return obs[0]
+    return None
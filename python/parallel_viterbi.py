@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import viterbi_engine
+
+# Largest model parallel_decode accepts, the work grows with the state count
+MAX_STATES = 64
+
+def parallel_decode(model, observations, workers=None, num_chunks=None):
+    """Decodes one long sequence on several cores with a chunked max-plus scan
+
+    1. Every chunk computes its transfer matrix in the pool (the first chunk
+       simply runs forward from the initial column).
+    2. The transfer matrices are scanned left to right in the parent, giving
+       the score column at every chunk boundary, and the argmax of each
+       combine is followed back from the final state to fix the state at
+       every boundary.
+    3. Every chunk re-runs forward from its boundary column and traces back
+       from its known final state in the pool.
+
+    Phase 1 costs N times the sequential recursion (see
+    viterbi_engine.transfer_matrix) and phase 3 repeats it once, so the total
+    work is about (N+1) times a sequential decode. It only pays off with more
+    than N+1 workers, so models above MAX_STATES states are refused. Sparse
+    transitions are densified.
+
+    The probability is re-accumulated along the path in the same order as the
+    sequential engine, so it is identical whenever the path is. The boundary
+    columns are summed in a different order and ties at a boundary go to the
+    lowest entry state, so the path can only differ between paths whose
+    scores tie to within floating point rounding.
+
+    Reduced precision models rescale every column and transfer matrix like
+    the sequential engine. Their probability is summed along the path rather
+    than from the rescaled columns, so it only agrees with model.decode to
+    within rounding.
+
+    Args:
+        model (HiddenMarkovModel): Compiled model
+        observations (list): Observations, in the observation space when one was provided
+        workers (int): Number of processes, defaults to the cpu count
+        num_chunks (int): Number of chunks, defaults to the number of workers
+
+    Returns:
+        path (list): The most likely state sequence
+        probability (float): The probability of that sequence
+
+    """
+    if model.num_states > MAX_STATES:
+        raise ValueError(f"parallel_decode does about (N+1) times the sequential work, "
+                         f"use model.decode for {model.num_states} states (limit {MAX_STATES})")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if num_chunks is None:
+        num_chunks = workers
+
+    observed = model.encode(observations)
+    num_observations = len(observed)
+    num_chunks = max(min(num_chunks, num_observations), 1)
+    bounds = np.linspace(0, num_observations, num_chunks + 1).astype(int)
+    chunks = [(bounds[c], bounds[c+1]) for c in range(num_chunks)]
+
+    params = (model.dense_transition_matrix(), model._emission_rows, model._initial_state_array_i, model.use_log_probabilities,
+              model._rescale)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=params) if workers > 1 else None
+    if pool is None:
+        _init_worker(*params)
+    run = pool.map if pool is not None else map
+
+    try:
+        # Phase 1: first chunk's final column and every other chunk's transfer matrix
+        summaries = list(run(_summarize_chunk, [(observed[start:stop], c == 0) for c, (start, stop) in enumerate(chunks)]))
+
+        # Phase 2: scan the boundary columns, then fix the state at each boundary
+        boundary_columns, final_states = _scan(summaries, model.use_log_probabilities, model._rescale)
+
+        # Phase 3: decode every chunk from its boundary column to its final state
+        tasks = [(observed[start:stop], boundary_columns[c], final_states[c]) for c, (start, stop) in enumerate(chunks)]
+        path = np.concatenate(list(run(_decode_chunk, tasks)))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return model.to_state_space(path), _path_probability(model, observed, path)
+
+def _scan(summaries, use_log_probabilities, rescale):
+    """ Boundary columns from the chunk summaries, and the final state of every chunk
+
+    With rescale every boundary column is kept at a max of one. A constant
+    factor changes no argmax, and the probability is re-accumulated along the
+    path, so the factors themselves are dropped.
+    """
+    combine = np.add if use_log_probabilities else np.multiply
+
+    # boundary_columns[c] is the column before chunk c, None for the first chunk
+    boundary_columns = [None]
+    column = summaries[0]
+    for transfer in summaries[1:]:
+        boundary_columns.append(column)
+        column = combine(column[:, None], transfer).max(axis=0)
+        if rescale:
+            viterbi_engine.rescale(column, use_log_probabilities, np.zeros(1))
+
+    # The best entry state of each chunk is the final state of the chunk before it
+    final_states = [int(np.argmax(column))]
+    for c in range(len(summaries) - 1, 0, -1):
+        final_states.append(int(np.argmax(combine(boundary_columns[c], summaries[c][:, final_states[-1]]))))
+    final_states.reverse()
+
+    return boundary_columns, final_states
+
+def _path_probability(model, observed, path):
+    """ Accumulates the path score left to right, in the order of the sequential engine """
+    combine = np.multiply if not model.use_log_probabilities else np.add
+
+    terms = np.empty(2 * len(path) - 1)
+    terms[0] = model.first_column(observed[0])[path[0]]
+    terms[1::2] = model._transition_matrix_a[path[:-1], path[1:]]
+    terms[2::2] = model._emission_rows[observed[1:], path[1:]]
+
+    return combine.accumulate(terms)[-1]
+
+# Per process state for parallel_decode
+_worker = dict()
+
+def _init_worker(transition_matrix, emission_rows, initial_state_array, use_log_probabilities, rescale):
+    """ Keeps the model matrices in every process """
+    _worker["transition"] = transition_matrix
+    _worker["emission_rows"] = emission_rows
+    _worker["initial"] = initial_state_array
+    _worker["use_log"] = use_log_probabilities
+    _worker["rescale"] = rescale
+
+def _new_scale():
+    """ Rescaling accumulator for reduced precision models, the factors are not needed """
+    return np.zeros(1) if _worker["rescale"] else None
+
+def _first_column(observation):
+    """ Accumulated probability of the first observation """
+    if _worker["use_log"]:
+        column = _worker["initial"] + _worker["emission_rows"][observation]
+    else:
+        column = _worker["initial"] * _worker["emission_rows"][observation]
+
+    if _worker["rescale"]:
+        viterbi_engine.rescale(column, _worker["use_log"], np.zeros(1))
+    return column
+
+def _summarize_chunk(task):
+    """ Final column of the first chunk, or the transfer matrix of any other """
+    observed, first = task
+    emission_columns = _worker["emission_rows"][observed]
+
+    if first:
+        return viterbi_engine.forward_pass(_worker["transition"], emission_columns[1:], _first_column(observed[0]),
+                                           _worker["use_log"],
+                                           scale=_new_scale())
+
+    return viterbi_engine.transfer_matrix(_worker["transition"], emission_columns, _worker["use_log"], scale=_new_scale())
+
+def _decode_chunk(task):
+    """ Viterbi path of one chunk given the column before it and its final state """
+    observed, column, final_state = task
+    emission_columns = _worker["emission_rows"][observed]
+    num_states = len(_worker["initial"])
+
+    # The first chunk starts from the initial column instead of a boundary
+    if column is None:
+        column = _first_column(observed[0])
+        emission_columns = emission_columns[1:]
+
+    backtrack = np.empty((len(emission_columns), num_states), dtype=viterbi_engine.backtrack_dtype(num_states))
+    viterbi_engine.forward_pass(_worker["transition"], emission_columns, column, _worker["use_log"],
+                                backtrack=backtrack,
+                                scale=_new_scale())
+
+    path = viterbi_engine.backtrack_path(backtrack, final_state)
+
+    # Outside the first chunk, path[0] is the state before the chunk
+    return path if len(path) == len(observed) else path[1:]
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import viterbi_engine
+
+class SparseTransitions(object):
+    """A transition matrix that only stores its possible transitions
+
+    Entries are kept sorted by destination state, then by source state, so
+    each Viterbi step is a gather over the previous column followed by one
+    segmented max per destination, O(number of nonzero transitions) instead
+    of O(N^2). Missing entries read as fill: 0 for linear probabilities and
+    -inf once converted with log().
+    """
+
+    def __init__(self, num_states, sources, destinations, values, fill=0.0, dtype=float):
+        """ Intialize Local Variables """
+
+        sources = np.asarray(sources, dtype=np.intp)
+        destinations = np.asarray(destinations, dtype=np.intp)
+        values = np.asarray(values, dtype=dtype)
+
+        # Sort by destination, then source, so ties resolve to the lowest source like argmax
+        order = np.lexsort((sources, destinations))
+        self._num_states = num_states
+        self._sources = sources[order]
+        self._destinations = destinations[order]
+        self._values = values[order]
+        self._fill = fill
+
+        # Segment of each destination that has at least one predecessor
+        counts = np.bincount(self._destinations, minlength=num_states)
+        self._reachable = np.flatnonzero(counts)
+        self._starts = (np.cumsum(counts) - counts)[self._reachable]
+        self._counts = counts[self._reachable]
+
+        # Row pointers of the same entries grouped by source, for expanding a few states
+        self._by_source = np.lexsort((self._destinations, self._sources))
+        self._source_indptr = np.r_[0, np.cumsum(np.bincount(self._sources, minlength=num_states))]
+        return
+
+    @classmethod
+    def from_dense(cls, matrix):
+        """Keeps the nonzero entries of a dense (source x destination) matrix"""
+        matrix = np.asarray(matrix, dtype=float)
+        sources, destinations = np.nonzero(matrix)
+        return cls(matrix.shape[0], sources, destinations, matrix[sources, destinations])
+
+    @classmethod
+    def from_csr(cls, indptr, indices, data, num_states=None):
+        """Builds from CSR arrays with one row per source state"""
+        indptr = np.asarray(indptr)
+        if num_states is None:
+            num_states = len(indptr) - 1
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return cls(num_states, sources, indices, data)
+
+    @classmethod
+    def from_banded(cls, bands):
+        """Builds from diagonals, bands maps offset k to the probabilities of i -> i+k
+
+        A left-to-right model with self loops and single skips is
+        {0: stay, 1: advance, 2: skip}; entries that fall outside the matrix are dropped.
+        """
+        num_states = len(next(iter(bands.values())))
+        sources, destinations, values = [], [], []
+        for offset, band in bands.items():
+            source = np.arange(num_states)
+            destination = source + offset
+            inside = (destination >= 0) & (destination < num_states)
+            sources.append(source[inside])
+            destinations.append(destination[inside])
+            values.append(np.asarray(band, dtype=float)[inside])
+
+        return cls(num_states, np.concatenate(sources), np.concatenate(destinations), np.concatenate(values))
+
+    @property
+    def shape(self):
+        return (self._num_states, self._num_states)
+
+    @property
+    def nnz(self):
+        return len(self._values)
+
+    def log(self):
+        """Log of every stored entry with the usual eps, missing entries become -inf"""
+        return SparseTransitions(self._num_states, self._sources, self._destinations,
+                                 np.log(self._values.astype(float) + np.finfo(float).eps),
+                                 fill=-np.inf,
+                                 dtype=self._values.dtype)
+
+    def astype(self, dtype, fill=None):
+        """Copy with values of another dtype, and optionally another fill"""
+        return SparseTransitions(self._num_states, self._sources, self._destinations, self._values,
+                                 fill=self._fill if fill is None else fill,
+                                 dtype=dtype)
+
+    @property
+    def dtype(self):
+        return self._values.dtype
+
+    def to_dense(self):
+        """Dense equivalent, with missing entries set to fill"""
+        matrix = np.full(self.shape, self._fill, dtype=self._values.dtype)
+        matrix[self._sources, self._destinations] = self._values
+        return matrix
+
+    def outgoing(self, sources):
+        """Stored transitions leaving the given states
+
+        Returns:
+            positions (ndarray): Index into sources of each transition
+            destinations (ndarray): Destination state of each transition
+            values (ndarray): Value of each transition
+
+        """
+        sources = np.asarray(sources, dtype=np.intp)
+        starts = self._source_indptr[sources]
+        counts = self._source_indptr[sources + 1] - starts
+
+        # Entry i of source k sits at starts[k] + i in the by source order
+        positions = np.repeat(np.arange(len(sources)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        entries = self._by_source[np.repeat(starts, counts) + offsets]
+
+        return positions, self._destinations[entries], self._values[entries]
+
+    def __getitem__(self, index):
+        """Entries at (sources, destinations) index arrays, fill where nothing is stored"""
+        sources, destinations = np.broadcast_arrays(*index)
+        keys = self._destinations * self._num_states + self._sources
+        wanted = destinations * self._num_states + sources
+
+        position = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+        found = keys[position] == wanted if len(keys) else np.zeros(wanted.shape, dtype=bool)
+        return np.where(found, self._values[position] if len(keys) else self._fill, self._fill)
+
+def sparse_forward_pass(transitions, emission_columns, column, use_log_probabilities, backtrack=None, scores=None, scale=None):
+    """viterbi_engine.forward_pass for SparseTransitions, O(nnz) per step
+
+    Destinations without any predecessor score fill and point back to state 0.
+    """
+    combine = np.add if use_log_probabilities else np.multiply
+    empty = -np.inf if use_log_probabilities else 0.0
+
+    sources = transitions._sources
+    destinations = transitions._destinations
+    values = transitions._values
+    reachable = transitions._reachable
+    starts = transitions._starts
+    counts = transitions._counts
+
+    best = np.zeros(transitions._num_states, dtype=np.intp)
+    best_score = np.full(transitions._num_states, empty, dtype=np.result_type(values, column))
+
+    for i in range(len(emission_columns)):
+        # Score of every stored transition
+        candidates = combine(column[sources], values)
+
+        # Max per destination, then the first source reaching it
+        segment_max = np.maximum.reduceat(candidates, starts)
+        hits = np.flatnonzero(candidates == np.repeat(segment_max, counts))
+        hit_destinations = destinations[hits]
+        first = np.r_[True, hit_destinations[1:] != hit_destinations[:-1]]
+
+        best[hit_destinations[first]] = sources[hits[first]]
+        best_score[reachable] = segment_max
+
+        column = combine(best_score, emission_columns[i])
+
+        if scale is not None:
+            viterbi_engine.rescale(column, use_log_probabilities, scale)
+
+        if backtrack is not None:
+            backtrack[i] = best
+
+        if scores is not None:
+            scores[i] = column
+
+    return column
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import tracemalloc
+import numpy as np
+import pytest
+from benchmark_viterbi import random_model
+from HiddenMarkovModel import HiddenMarkovModel
+
+@pytest.mark.parametrize("use_log_probabilities", [True, False])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_batch_matches_single_sequence_decode(use_log_probabilities, dtype):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(7, 6, seed=8)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              use_log_probabilities=use_log_probabilities,
+                              dtype=dtype)
+
+    # Mixed lengths with ties, single steps and one long tail
+    rng = np.random.default_rng(9)
+    sequences = [rng.integers(0, 6, length) for length in (30, 1, 12, 12, 400, 2, 30, 1)]
+
+    paths, probabilities = model.decode_batch(sequences)
+    for sequence, path, probability in zip(sequences, paths, probabilities):
+        expected_path, expected_probability = model.decode_indices(sequence)
+        assert np.array_equal(path, expected_path)
+        assert probability == expected_probability
+
+def test_finished_sequences_release_their_width():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(10, 6, seed=10)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    rng = np.random.default_rng(11)
+    sequences = [rng.integers(0, 6, 10000)] + [rng.integers(0, 6, 5) for _ in range(1000)]
+
+    # A (steps x batch x states) backtrack alone would be about 100 MB
+    tracemalloc.start()
+    model.decode_batch(sequences)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 8 << 20
+
+def test_empty_batches():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(3, 6, seed=12)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability)
+    paths, probabilities = model.decode_batch([])
+    assert paths == [] and len(probabilities) == 0
+    with pytest.raises(ValueError):
+        model.decode_batch([[1, 2], []])
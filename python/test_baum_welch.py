@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from baum_welch import baum_welch
+from benchmark_viterbi import random_model
+from generate_observations import generate_observations
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunks_match_the_whole_sequence(workers):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(3, 4, seed=2)
+    _, observations = generate_observations(initial_state_probability, transition_matrix, emission_matrix,
+                                            num_samples=5000,
+                                            seed=1)
+    guess = random_model(3, 4, seed=5)
+
+    whole = baum_welch(*guess, [observations], runs=5, workers=1)
+    chunked = baum_welch(*guess, [observations], runs=5, chunk_size=777, workers=workers)
+
+    for expected, actual in zip(whole[:3], chunked[:3]):
+        assert np.allclose(actual, expected, rtol=1e-9, atol=1e-12)
+
+    log_likelihoods = [entry["log_likelihood"] for entry in chunked[3]]
+    assert np.allclose(log_likelihoods, [entry["log_likelihood"] for entry in whole[3]], rtol=1e-12)
+
+    # EM never decreases the likelihood of the whole sequence
+    assert all(b >= a - 1e-9 for a, b in zip(log_likelihoods, log_likelihoods[1:]))
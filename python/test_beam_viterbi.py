@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from benchmark_viterbi import random_model
+from BeamViterbi import BeamViterbi
+from HiddenMarkovModel import HiddenMarkovModel
+from sparse_transitions import SparseTransitions
+
+def banded_transitions(num_states):
+    return SparseTransitions.from_banded({0: np.full(num_states, 0.6), 1: np.full(num_states, 0.3),
+                                          2: np.full(num_states, 0.1)})
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_full_width_beam_is_exact(sparse):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(30, 6, seed=13)
+    transitions = banded_transitions(30) if sparse else transition_matrix
+    model = HiddenMarkovModel(transitions, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    sequences = [np.random.default_rng(seed).integers(0, 6, 300) for seed in range(3)]
+
+    beam = BeamViterbi(model, beam_width=30)
+    for observed in sequences:
+        path, probability = beam.decode_indices(observed)
+        expected_path, expected_probability = model.decode_indices(observed)
+        assert np.array_equal(path, expected_path)
+        assert probability == expected_probability
+
+    report = beam.compare_with_exact(sequences)
+    assert report["changed_paths"] == 0
+    assert report["mean_log_probability_loss"] == 0.0
+
+def test_narrow_beam_never_beats_exact():
+    num_states = 2000
+    rng = np.random.default_rng(14)
+    emission_matrix = rng.random((num_states, 6))
+    emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+    model = HiddenMarkovModel(banded_transitions(num_states), emission_matrix, np.full(num_states, 1.0 / num_states),
+                              use_log_probabilities=True)
+
+    report = BeamViterbi(model, beam_width=20).compare_with_exact([rng.integers(0, 6, 100)])
+    assert report["mean_log_probability_loss"] >= 0.0
+    assert report["mean_active_states"] == 20.0
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import asyncio
+import json
+import threading
+import numpy as np
+import decode_server
+from benchmark_viterbi import loaded_die_model
+from decode_server import DecodeServer
+from HiddenMarkovModel import HiddenMarkovModel
+from model_io import save_model
+
+def save_die(tmp_path):
+    initial_state_probability, transition_matrix, emission_matrix = loaded_die_model()
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              state_space=['F', 'L'],
+                              observation_space=['1', '2', '3', '4', '5', '6'],
+                              use_log_probabilities=True)
+    path = str(tmp_path / "die.npz")
+    save_model(path, model)
+    return model, path
+
+def test_concurrent_requests_are_batched(tmp_path):
+    model, path = save_die(tmp_path)
+    rng = np.random.default_rng(15)
+    sequences = [[str(symbol) for symbol in rng.integers(1, 7, 20)] for _ in range(10)]
+
+    async def exchange():
+        server = DecodeServer({"die": path}, max_batch_size=4, max_wait=0.05, max_in_flight=1)
+        listener = await asyncio.start_unix_server(server.handle_connection, path=str(tmp_path / "die.sock"))
+        async with listener:
+            reader, writer = await asyncio.open_unix_connection(str(tmp_path / "die.sock"))
+            for i, sequence in enumerate(sequences):
+                writer.write(json.dumps({"id": i, "model": "die", "observations": sequence}).encode() + b"\n")
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in sequences]
+
+            writer.write(json.dumps({"id": "m", "op": "metrics"}).encode() + b"\n")
+            metrics = json.loads(await reader.readline())["metrics"]
+            writer.close()
+        return responses, metrics
+
+    responses, metrics = asyncio.run(exchange())
+
+    for response in responses:
+        path, score = model.decode(sequences[response["id"]])
+        assert response["path"] == list(path)
+        assert response["score"] == score
+
+    assert metrics["requests"] == 10 and metrics["errors"] == 0
+    assert metrics["batches_in_flight"] == 0 and metrics["total_queue_depth"] == 0
+    sizes = {int(size): count for size, count in metrics["batch_sizes"].items()}
+    assert sum(size * count for size, count in sizes.items()) == 10
+    assert max(sizes) <= 4 and metrics["batches"] < 10
+
+def test_busy_executor_leaves_requests_queued(tmp_path, monkeypatch):
+    _, path = save_die(tmp_path)
+    release = threading.Event()
+    decode_batch = decode_server._decode_batch
+
+    def blocked_decode_batch(model_path, records):
+        release.wait(5)
+        return decode_batch(model_path, records)
+
+    monkeypatch.setattr(decode_server, "_decode_batch", blocked_decode_batch)
+
+    async def run():
+        server = DecodeServer({"die": path}, max_batch_size=2, max_wait=0.01, max_in_flight=1)
+        requests = [asyncio.create_task(server.decode("die", ["6", "6"])) for _ in range(6)]
+        await asyncio.sleep(0.2)
+        busy = server.metrics()
+
+        release.set()
+        await asyncio.gather(*requests)
+        return busy, server.metrics()
+
+    busy, done = asyncio.run(run())
+
+    # One batch decoding, the rest still visible in the queue
+    assert busy["batches_in_flight"] == 1
+    assert busy["total_queue_depth"] == 4
+    assert done["batch_sizes"] == {"2": 3}
+    assert done["total_queue_depth"] == 0
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+from benchmark_viterbi import random_model
+from generate_observations import ObservationSampler
+
+def reference_sample(sampler, state_uniforms, observation_uniforms):
+    """ One np.searchsorted per step over the sampler's cumulative tables """
+    states = np.zeros(len(state_uniforms), dtype=int)
+    states[0] = np.searchsorted(sampler._initial_cdf, state_uniforms[0], side="right")
+    for t in range(1, len(states)):
+        states[t] = np.searchsorted(sampler._transition_cdf[states[t-1]], state_uniforms[t], side="right")
+
+    observations = np.array([np.searchsorted(sampler._emission_cdf[state], uniform, side="right")
+                             for state, uniform in zip(states, observation_uniforms)])
+    return states, observations
+
+def test_sampler_matches_per_step_lookup():
+    for num_states in (1, 2, 7, 60):
+        initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 5, seed=num_states)
+        sampler = ObservationSampler(initial_state_probability, transition_matrix, emission_matrix)
+
+        rng = np.random.default_rng(num_states)
+        state_uniforms = rng.random(3000)
+        observation_uniforms = rng.random(3000)
+        expected_states, expected_observations = reference_sample(sampler, state_uniforms, observation_uniforms)
+
+        # Both the list and the array lookups
+        for rows in (sampler._transition_rows, None):
+            sampler._transition_rows = rows
+            states = sampler._sample_states(state_uniforms)
+            assert np.array_equal(states, expected_states)
+            assert np.array_equal(sampler._sample_observations(states, observation_uniforms), expected_observations)
+
+def test_sampler_is_reproducible():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(4, 6, seed=1)
+    sampler = ObservationSampler(initial_state_probability, transition_matrix, emission_matrix)
+    first = sampler.sample(1000, rng=515)
+    second = sampler.sample(1000, rng=515)
+    assert np.array_equal(first[0], second[0]) and np.array_equal(first[1], second[1])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from benchmark_viterbi import random_model
+from HiddenMarkovModel import HiddenMarkovModel
+
+def test_threads_share_one_model():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(30, 6, seed=1)
+    shared = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    rng = np.random.default_rng(0)
+    sequences = [rng.integers(0, 6, rng.integers(2000, 4000)) for _ in range(16)]
+
+    for memory_mode in ("full", "low", "checkpoint"):
+        expected = [HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                      use_log_probabilities=True).decode_indices(sequence, memory_mode=memory_mode)
+                    for sequence in sequences]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda sequence: shared.decode_indices(sequence, memory_mode=memory_mode),
+                                        sequences))
+
+        for (path, probability), (expected_path, expected_probability) in zip(results, expected):
+            assert np.array_equal(path, expected_path)
+            assert probability == expected_probability
+
+def test_peak_memory_estimate_matches_traced_allocations():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(10, 6, seed=1)
+    observations = np.random.default_rng(0).integers(0, 6, 20000)
+
+    for memory_mode in ("full", "low", "checkpoint"):
+        model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+        model.decode_indices(observations[:10], memory_mode=memory_mode)
+
+        tracemalloc.start()
+        try:
+            model.decode_indices(observations, memory_mode=memory_mode)
+            _, traced = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert abs(model.peak_memory_bytes - traced) <= 0.05 * traced
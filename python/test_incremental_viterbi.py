@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from benchmark_viterbi import random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from IncrementalViterbi import IncrementalViterbi
+from sparse_transitions import SparseTransitions
+
+# Linear scores underflow quickly in float64 without rescaling, so those sequences stay short
+CONFIGURATIONS = [
+    ("log", dict(use_log_probabilities=True), 150),
+    ("linear", dict(), 15),
+    ("log float32", dict(use_log_probabilities=True, dtype=np.float32), 150),
+    ("linear float32", dict(dtype=np.float32), 150),
+]
+
+@pytest.mark.parametrize("name, options, max_append", CONFIGURATIONS)
+@pytest.mark.parametrize("sparse", [False, True])
+def test_random_updates_match_a_full_decode(name, options, max_append, sparse):
+    rng = np.random.default_rng(7)
+
+    for num_states in (1, 2, 5, 20):
+        initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=num_states)
+        if sparse:
+            # Drop some transitions so the sparse path really skips entries
+            transition_matrix = np.where(rng.random(transition_matrix.shape) < 0.3, 0.0, transition_matrix)
+            transition_matrix[np.arange(num_states), np.arange(num_states)] += 0.1
+            transition_matrix /= transition_matrix.sum(axis=1, keepdims=True)
+            transition_matrix = SparseTransitions.from_dense(transition_matrix)
+
+        model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, **options)
+        reference = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, **options)
+
+        for checkpoint_interval in (1, 3, 64):
+            incremental = IncrementalViterbi(model, checkpoint_interval=checkpoint_interval)
+            observations = np.zeros(0, dtype=int)
+
+            for _ in range(25):
+                choice = rng.random()
+                if choice < 0.5 or len(observations) == 0:
+                    update = rng.integers(0, 6, rng.integers(0, max_append + 1))
+                    incremental.append(update)
+                    observations = np.concatenate([observations, update])
+                elif choice < 0.8:
+                    position = int(rng.integers(0, len(observations) + 1))
+                    update = rng.integers(0, 6, rng.integers(1, 30))
+                    incremental.edit(position, update)
+                    observations = np.concatenate([observations[:position], update,
+                                                   observations[position + len(update):]])
+                else:
+                    length = int(rng.integers(0, len(observations) + 1))
+                    incremental.truncate(length)
+                    observations = observations[:length]
+
+                assert len(incremental) == len(observations)
+                if len(observations) == 0:
+                    continue
+
+                path, probability = incremental.decode_indices()
+                expected_path, expected_probability = reference.decode_indices(observations)
+                assert np.array_equal(path, expected_path)
+                assert probability == expected_probability
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from benchmark_viterbi import loaded_die_model, random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from mmap_decode import decode_file
+
+@pytest.mark.parametrize("use_log_probabilities, dtype", [(True, np.float64), (True, np.float32),
+                                                          (False, np.float64), (False, np.float32)])
+@pytest.mark.parametrize("block_size", [None, 7])
+def test_npy_input_matches_decode_indices(tmp_path, use_log_probabilities, dtype, block_size):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(5, 6, seed=19)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              use_log_probabilities=use_log_probabilities,
+                              dtype=dtype)
+
+    # Short enough that linear float64 does not underflow
+    observations = np.random.default_rng(20).integers(0, 6, 2000 if use_log_probabilities else 250)
+    np.save(tmp_path / "rolls.npy", observations)
+
+    options = dict() if block_size is None else dict(block_size=block_size)
+    path, probability = decode_file(model, str(tmp_path / "rolls.npy"), str(tmp_path / "path.npy"), **options)
+
+    expected_path, expected_probability = model.decode_indices(observations)
+    assert np.array_equal(path, expected_path)
+    assert np.array_equal(np.load(tmp_path / "path.npy"), expected_path)
+    assert probability == expected_probability
+
+def test_raw_bytes_go_through_the_observation_space(tmp_path):
+    initial_state_probability, transition_matrix, emission_matrix = loaded_die_model()
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              observation_space=['1', '2', '3', '4', '5', '6'],
+                              use_log_probabilities=True)
+    rolls = "".join(str(roll) for roll in np.random.default_rng(21).integers(1, 7, 3000))
+    (tmp_path / "rolls.txt").write_bytes(rolls.encode())
+
+    path, probability = decode_file(model, str(tmp_path / "rolls.txt"), str(tmp_path / "path.bin"), block_size=256)
+
+    expected_path, expected_probability = model.decode_indices(model.encode(rolls))
+    assert np.array_equal(path, expected_path)
+    assert np.array_equal(np.fromfile(tmp_path / "path.bin", dtype=path.dtype), expected_path)
+    assert probability == expected_probability
+
+def test_single_observation_file(tmp_path):
+    initial_state_probability, transition_matrix, emission_matrix = loaded_die_model()
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    np.save(tmp_path / "roll.npy", np.array([5]))
+
+    path, probability = decode_file(model, str(tmp_path / "roll.npy"), str(tmp_path / "path.npy"))
+
+    expected_path, expected_probability = model.decode_indices(np.array([5]))
+    assert np.array_equal(path, expected_path) and len(path) == 1
+    assert probability == expected_probability
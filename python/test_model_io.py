@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import os
+import time
+import numpy as np
+from benchmark_viterbi import random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from model_io import ModelCache, load_model, save_model
+
+def test_save_and_load_decode_the_same(tmp_path):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(5, 6, seed=3)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    save_model(str(tmp_path / "model.npz"), model)
+    loaded = load_model(str(tmp_path / "model.npz"))
+
+    observations = np.random.default_rng(0).integers(0, 6, 500)
+    path, probability = loaded.decode_indices(observations)
+    expected_path, expected_probability = model.decode_indices(observations)
+    assert np.array_equal(path, expected_path)
+    assert probability == expected_probability
+
+def test_cache_hit_skips_reading_until_the_file_changes(tmp_path):
+    path = str(tmp_path / "model.npz")
+    initial_state_probability, transition_matrix, emission_matrix = random_model(3, 4, seed=1)
+    save_model(path, HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability))
+
+    cache = ModelCache(max_models=2)
+    first = cache.get(path)
+    assert cache.get(path) is first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A rewrite with a new modification time is read and hashed again
+    save_model(path, HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability[::-1]))
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    assert cache.get(path) is not first
+    assert cache.misses == 2
+
+def test_rewrite_with_preserved_mtime_is_reloaded(tmp_path):
+    path = str(tmp_path / "model.npz")
+    initial_state_probability, transition_matrix, emission_matrix = random_model(3, 4, seed=1)
+    save_model(path, HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability))
+
+    cache = ModelCache()
+    first = cache.get(path)
+    info = os.stat(path)
+
+    # Same size and modification time, like cp -p, but a later change time
+    time.sleep(0.05)
+    save_model(path, HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability[::-1]))
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns))
+    assert os.stat(path).st_size == info.st_size
+
+    reloaded = cache.get(path)
+    assert reloaded is not first
+    assert np.array_equal(reloaded._initial_state_array_i, first._initial_state_array_i[::-1])
+
+def test_one_stamp_per_path(tmp_path):
+    path = str(tmp_path / "model.npz")
+    initial_state_probability, transition_matrix, emission_matrix = random_model(3, 4, seed=1)
+    save_model(path, HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability))
+
+    cache = ModelCache()
+    for _ in range(5):
+        info = os.stat(path)
+        os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+        cache.get(path)
+
+    # Touching only changes the stamp, the contents hash to the same model
+    assert len(cache._stamps) == 1
+    assert (len(cache), cache.misses, cache.hits) == (1, 1, 4)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from observation_encoding import ObservationEncoder
+
+DIE = ['1', '2', '3', '4', '5', '6']
+ROLLS = "1626354"
+EXPECTED = [0, 5, 1, 5, 2, 4, 3]
+
+@pytest.mark.parametrize("observations", [
+    ROLLS,
+    ROLLS.encode(),
+    list(ROLLS),
+    np.array(list(ROLLS)),
+    (symbol for symbol in ROLLS),
+    iter(list(ROLLS)),
+])
+def test_single_character_inputs(observations):
+    assert ObservationEncoder(DIE).encode(observations).tolist() == EXPECTED
+
+@pytest.mark.parametrize("space", [DIE, ['one', 'two', 'three'], [10, 20, 30], [('a', 1), ('b', 2)]])
+def test_every_path_matches_the_dict(space):
+    sequence = [space[i] for i in (2, 0, 1, 1, 0)] if len(space) > 2 else [space[i] for i in (1, 0, 1)]
+    expected = [space.index(obs) for obs in sequence]
+
+    encoder = ObservationEncoder(space)
+    assert encoder.encode(sequence).tolist() == expected
+    assert encoder.encode(obs for obs in sequence).tolist() == expected
+
+def test_index_arrays_pass_through():
+    observations = np.array([2, 0, 1])
+    assert ObservationEncoder().encode(observations) is observations
+    assert ObservationEncoder().encode(iter([2, 0, 1])).tolist() == [2, 0, 1]
+
+@pytest.mark.parametrize("space, observations", [
+    (DIE, "1627"),
+    (DIE, b"1627"),
+    (DIE, (symbol for symbol in "1627")),
+    (['one', 'two'], ['one', 'seven']),
+    ([10, 20], [10, 70]),
+])
+def test_unknown_symbols_raise_key_error(space, observations):
+    with pytest.raises(KeyError):
+        ObservationEncoder(space).encode(observations)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+import viterbi_engine
+from benchmark_viterbi import PATH_MATCH_FRACTION, PRECISION_TOLERANCE, random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from parallel_viterbi import MAX_STATES, parallel_decode
+
+def test_parallel_matches_sequential():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(6, 4, seed=3)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    observations = list(np.random.default_rng(4).integers(0, 4, 3000))
+    expected_path, expected_probability = model.decode(observations)
+
+    # The path may only swap between paths whose scores tie to within
+    # rounding, which re-accumulate to the same probability
+    for workers, num_chunks in ((1, 1), (1, 7), (2, 2), (2, 5)):
+        path, probability = parallel_decode(model, observations, workers=workers, num_chunks=num_chunks)
+        assert probability == expected_probability
+        assert np.mean(np.asarray(path) == np.asarray(expected_path)) >= 0.99
+
+@pytest.mark.parametrize("use_log_probabilities, num_observations", [(True, 3000), (False, 200)])
+def test_float32_is_rescaled_like_the_sequential_decode(use_log_probabilities, num_observations):
+    initial_state_probability, transition_matrix, emission_matrix = random_model(6, 4, seed=3)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              use_log_probabilities=use_log_probabilities,
+                              dtype=np.float32)
+    observations = list(np.random.default_rng(4).integers(0, 4, num_observations))
+    expected_path, expected_probability = model.decode(observations)
+    to_log = (lambda value: value) if use_log_probabilities else np.log
+
+    # Same bounds as test_precision.py, on log probabilities
+    for workers, num_chunks in ((1, 1), (1, 7), (2, 5)):
+        path, probability = parallel_decode(model, observations, workers=workers, num_chunks=num_chunks)
+        assert np.mean(np.asarray(path) == np.asarray(expected_path)) >= PATH_MATCH_FRACTION
+        assert abs(to_log(probability) - to_log(expected_probability)) <= PRECISION_TOLERANCE * abs(to_log(expected_probability))
+
+def test_blocked_transfer_matrix_matches_broadcast(monkeypatch):
+    _, transition_matrix, emission_matrix = random_model(9, 3, seed=5)
+    transition_matrix, emission_matrix = np.log(transition_matrix), np.log(emission_matrix)
+    emission_columns = emission_matrix.T[np.random.default_rng(6).integers(0, 3, 40)]
+
+    expected = transition_matrix + emission_columns[0][None, :]
+    for column in emission_columns[1:]:
+        expected = (expected[:, :, None] + transition_matrix[None, :, :]).max(axis=1) + column
+
+    # Two destination states per block
+    monkeypatch.setattr(viterbi_engine, "TRANSFER_BLOCK_ELEMENTS", 2 * 9 * 9)
+    assert np.array_equal(viterbi_engine.transfer_matrix(transition_matrix, emission_columns, True), expected)
+
+def test_too_many_states_is_refused():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(MAX_STATES + 1, 2, seed=7)
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    with pytest.raises(ValueError):
+        parallel_decode(model, [0, 1, 0], workers=1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+from benchmark_viterbi import PATH_MATCH_FRACTION, PRECISION_TOLERANCE, precision_models
+from HiddenMarkovModel import HiddenMarkovModel
+
+def test_float32_matches_float64_within_tolerance():
+    for name, (initial_state_probability, transition_matrix, emission_matrix) in precision_models():
+        num_symbols = np.shape(emission_matrix)[1]
+        exact = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                  use_log_probabilities=True)
+        reduced = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                                    use_log_probabilities=True,
+                                    dtype=np.float32)
+
+        for num_observations in (300, 10000):
+            observations = np.random.default_rng(515).integers(0, num_symbols, num_observations)
+            expected_path, expected_probability = exact.decode_indices(observations)
+
+            for memory_mode in ("full", "low", "checkpoint"):
+                path, probability = reduced.decode_indices(observations, memory_mode=memory_mode)
+                assert abs(probability - expected_probability) <= PRECISION_TOLERANCE * abs(expected_probability), name
+                assert np.mean(path == expected_path) >= PATH_MATCH_FRACTION, name
+
+def test_log_space_input_is_identical():
+    initial_state_probability, transition_matrix, emission_matrix = precision_models()[1][1]
+    eps = np.finfo(float).eps
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability, use_log_probabilities=True)
+    logged = HiddenMarkovModel(np.log(transition_matrix + eps), np.log(emission_matrix + eps),
+                               np.log(initial_state_probability + eps),
+                               use_log_probabilities=True,
+                               log_space_input=True)
+
+    observations = np.random.default_rng(0).integers(0, 6, 2000)
+    path, probability = logged.decode_indices(observations)
+    expected_path, expected_probability = model.decode_indices(observations)
+    assert np.array_equal(path, expected_path)
+    assert probability == expected_probability
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+from benchmark_viterbi import random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from sparse_transitions import SparseTransitions
+
+def banded_model(num_states, seed=515):
+    """ Left-to-right model: stay, advance one state or skip one state """
+    rng = np.random.default_rng(seed)
+    bands = {0: np.full(num_states, 0.6), 1: np.full(num_states, 0.3), 2: np.full(num_states, 0.1)}
+    emission_matrix = rng.random((num_states, 6))
+    emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+    return SparseTransitions.from_banded(bands), emission_matrix, np.full(num_states, 1.0 / num_states)
+
+def test_banded_sparse_matches_dense():
+    # Linear mode keeps missing transitions at exactly zero in both forms
+    for num_states in (3, 40):
+        sparse, emission_matrix, initial_state_probability = banded_model(num_states)
+        observations = np.random.default_rng(0).integers(0, 6, 150)
+
+        dense_model = HiddenMarkovModel(sparse.to_dense(), emission_matrix, initial_state_probability)
+        sparse_model = HiddenMarkovModel(sparse, emission_matrix, initial_state_probability)
+
+        for memory_mode in ("full", "low", "checkpoint"):
+            path, probability = sparse_model.decode_indices(observations, memory_mode=memory_mode)
+            expected_path, expected_probability = dense_model.decode_indices(observations, memory_mode=memory_mode)
+            assert np.array_equal(path, expected_path)
+            assert probability == expected_probability
+
+def test_log_sparse_matches_dense_with_impossible_transitions():
+    # Dense log(0 + eps) is not -inf, so compare against a dense -inf matrix
+    sparse, emission_matrix, initial_state_probability = banded_model(20)
+    logged = sparse.log()
+    eps = np.finfo(float).eps
+    observations = np.random.default_rng(1).integers(0, 6, 2000)
+
+    sparse_model = HiddenMarkovModel(logged, np.log(emission_matrix + eps), np.log(initial_state_probability + eps),
+                                     use_log_probabilities=True,
+                                     log_space_input=True)
+    dense_model = HiddenMarkovModel(logged.to_dense(), np.log(emission_matrix + eps),
+                                    np.log(initial_state_probability + eps),
+                                    use_log_probabilities=True,
+                                    log_space_input=True)
+
+    path, probability = sparse_model.decode_indices(observations)
+    expected_path, expected_probability = dense_model.decode_indices(observations)
+    assert np.array_equal(path, expected_path)
+    assert probability == expected_probability
+
+def test_from_dense_round_trips():
+    _, transition_matrix, _ = random_model(7, 3, seed=2)
+    transition_matrix[transition_matrix < 0.1] = 0.0
+    sparse = SparseTransitions.from_dense(transition_matrix)
+    assert np.array_equal(sparse.to_dense(), transition_matrix)
+    assert sparse.nnz == np.count_nonzero(transition_matrix)
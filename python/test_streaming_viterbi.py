@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from benchmark_viterbi import loaded_die_model, random_model
+from HiddenMarkovModel import HiddenMarkovModel
+from StreamingViterbi import StreamingViterbi
+
+@pytest.mark.parametrize("use_log_probabilities", [True, False])
+def test_unbounded_lag_matches_full_decode(use_log_probabilities):
+    initial_state_probability, transition_matrix, emission_matrix = loaded_die_model()
+    space = dict(state_space=['F', 'L'], observation_space=['1', '2', '3', '4', '5', '6'])
+    observations = [str(roll) for roll in np.random.default_rng(16).integers(1, 7, 600)]
+
+    stream = StreamingViterbi(transition_matrix, emission_matrix, initial_state_probability,
+                              use_log_probabilities=use_log_probabilities, **space)
+    path = list(stream.decode(observations))
+
+    model = HiddenMarkovModel(transition_matrix, emission_matrix, initial_state_probability,
+                              use_log_probabilities=use_log_probabilities, **space)
+    expected_path, expected_probability = model.decode(observations)
+    assert path == list(expected_path)
+    assert stream.num_finalized == len(observations)
+
+    # Linear scores are kept rescaled, so only rounding separates the probabilities
+    if use_log_probabilities:
+        assert stream.viterbi_probability == expected_probability
+    else:
+        assert np.isclose(stream.viterbi_probability, expected_probability, rtol=1e-9, atol=0)
+
+def test_pending_rows_never_exceed_max_lag():
+    initial_state_probability, transition_matrix, emission_matrix = random_model(8, 6, seed=17)
+    observations = np.random.default_rng(18).integers(0, 6, 2000)
+
+    for max_lag in (1, 5, 40):
+        stream = StreamingViterbi(transition_matrix, emission_matrix, initial_state_probability,
+                                  use_log_probabilities=True,
+                                  max_lag=max_lag)
+        emitted = []
+        for observation in observations:
+            emitted += stream.push(observation)
+            assert stream.num_observations - stream.num_finalized <= max_lag
+            assert len(emitted) == stream.num_finalized
+
+        emitted += stream.flush()
+        assert len(emitted) == len(observations)
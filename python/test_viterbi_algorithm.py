@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import pytest
+from benchmark_viterbi import random_model, reference_run
+from ViterbiAlgorithm import ViterbiAlgorithm
+
+@pytest.mark.parametrize("use_log_probabilities", [True, False])
+def test_run_matches_per_state_loop(use_log_probabilities):
+    # Short enough that linear mode does not underflow
+    for num_states, num_observations in ((2, 1), (3, 50), (12, 200)):
+        initial_state_probability, transition_matrix, emission_matrix = random_model(num_states, 6, seed=num_states)
+        observations = np.random.default_rng(num_observations).integers(0, 6, num_observations)
+
+        expected_path, expected_probability = reference_run(transition_matrix, emission_matrix,
+                                                            initial_state_probability, observations,
+                                                            use_log_probabilities)
+        v = ViterbiAlgorithm(transition_matrix, emission_matrix, initial_state_probability, observations,
+                             use_log_probabilities=use_log_probabilities)
+        v.run()
+        assert np.array_equal(v.viterbi_path, expected_path)
+        assert v.viterbi_probability == expected_probability
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import json
+import tracemalloc
+import numpy as np
+from HiddenMarkovModel import HiddenMarkovModel
+from model_io import save_matrices, save_model
+from sparse_transitions import SparseTransitions
+import viterbi_cli
+
+def test_malformed_records_do_not_stop_the_run(tmp_path, capsys):
+    model_path = str(tmp_path / "die.npz")
+    save_matrices(model_path, [0.9999, 0.0001], [[0.95, 0.05], [0.10, 0.90]],
+                  [[1/6, 1/6, 1/6, 1/6, 1/6, 1/6], [0.1, 0.1, 0.1, 0.1, 0.1, 0.5]],
+                  state_space=['F', 'L'],
+                  observation_space=['1', '2', '3', '4', '5', '6'])
+
+    records = tmp_path / "rolls.jsonl"
+    records.write_text('{"id": "a", "observations": ["1", "6"]}\n'
+                       'not json\n'
+                       '{"id": "b"}\n'
+                       '["6", "6", "7"]\n'
+                       '["6", "6", "6"]\n')
+
+    status = viterbi_cli.main([model_path, str(records), "--workers", "1", "--chunk-size", "2"])
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert status == 1
+    assert [result["id"] for result in results] == ["a", 1, 2, 3, 4]
+    assert [("error" in result) for result in results] == [False, True, True, True, False]
+    assert results[4]["path"] == ["F", "F", "F"]
+
+def test_sparse_model_decodes_per_sequence(tmp_path, capsys):
+    # A batched broadcast would need (batch x 800 x 800) per step
+    num_states = 800
+    rng = np.random.default_rng(3)
+    emission_matrix = rng.random((num_states, 6))
+    emission_matrix /= emission_matrix.sum(axis=1, keepdims=True)
+    bands = {0: np.full(num_states, 0.7), 1: np.full(num_states, 0.3)}
+    model = HiddenMarkovModel(SparseTransitions.from_banded(bands), emission_matrix,
+                              np.full(num_states, 1.0 / num_states),
+                              observation_space=['1', '2', '3', '4', '5', '6'],
+                              use_log_probabilities=True)
+    model_path = str(tmp_path / "banded.npz")
+    save_model(model_path, model)
+
+    sequences = [[str(symbol) for symbol in rng.integers(1, 7, length)] for length in (40, 1, 25, 40)]
+    records = tmp_path / "rolls.jsonl"
+    records.write_text("".join(json.dumps(sequence) + "\n" for sequence in sequences))
+
+    status = viterbi_cli.main([model_path, str(records), "--workers", "1", "--chunk-size", "4"])
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    assert status == 0
+    for result, sequence in zip(results, sequences):
+        path, probability = model.decode(sequence)
+        assert result["path"] == list(path)
+        assert result["score"] == probability
+
+    # The dense transition matrix alone would be 5 MB
+    tracemalloc.start()
+    model.decode_batch(sequences)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak < 4 << 20
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+from model_io import cached_load_model
+
+# Errors of a record that cannot be parsed, reported for that record only
+RECORD_ERRORS = (ValueError, KeyError, TypeError, AttributeError)
+
+def read_records(stream, input_format="jsonl", field="observations", first_id=0):
+    """Yields (id, observations, error) for every record of a JSONL or CSV stream
+
+    JSONL lines are either a list of observations or an object holding them
+    in field, with an optional "id". CSV files need a header with field and
+    optionally "id". The field is split on whitespace, or into single
+    characters when it has none ("16663" is five rolls). Records without an
+    id are numbered from first_id.
+
+    A record that cannot be parsed, or lacks field, is yielded with
+    observations None and error set, so it does not stop the stream.
+    """
+    record_id = first_id
+    if input_format == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                record = json.loads(line)
+                if isinstance(record, list):
+                    yield record_id, record, None
+                else:
+                    yield record.get("id", record_id), record[field], None
+            except RECORD_ERRORS as error:
+                yield record_id, None, f"line {line_number}: {type(error).__name__}: {error}"
+            record_id += 1
+
+    elif input_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            try:
+                value = row[field].strip()
+                yield row.get("id", record_id), value.split() if any(c.isspace() for c in value) else list(value), None
+            except RECORD_ERRORS as error:
+                yield row.get("id", record_id), None, f"line {reader.line_num}: {type(error).__name__}: {error}"
+            record_id += 1
+
+    else:
+        raise ValueError("Unknown input format: " + str(input_format))
+
+def decode_records(model_path, records, workers=None, chunk_size=64, max_in_flight=None):
+    """Decodes records in a process pool, yielding results in input order
+
+    Records are (id, observations, error) tuples as yielded by read_records.
+    They are grouped into chunks of chunk_size, and the records of a chunk
+    without an error are decoded as one batch. At most max_in_flight chunks
+    are queued at a time (default two per worker), so memory stays bounded
+    however long the input is.
+
+    Yields:
+        result (tuple): (id, path, score, error), path and score are None when error is set
+
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) if workers > 1 else None
+    if pool is None:
+        _init_worker(model_path)
+
+    def submit(chunk):
+        valid = [(record_id, observations) for record_id, observations, error in chunk if error is None]
+        if pool is not None:
+            return pool.submit(_decode_chunk, valid)
+        future = Future()
+        future.set_result(_decode_chunk(valid))
+        return future
+
+    def results(chunk, future):
+        # Put the unparsed records back in their place
+        decoded = iter(future.result())
+        return [next(decoded) if error is None else (record_id, None, None, error)
+                for record_id, _, error in chunk]
+
+    records = iter(records)
+    pending = deque()
+    try:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            pending.append((chunk, submit(chunk)))
+            if len(pending) >= max_in_flight:
+                yield from results(*pending.popleft())
+
+        while pending:
+            yield from results(*pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def write_result(stream, result, output_format="jsonl"):
+    """Writes one decoded record as a JSON line or a CSV row"""
+    record_id, path, score, error = result
+    if output_format == "jsonl":
+        if error is not None:
+            stream.write(json.dumps({"id": record_id, "error": error}) + "\n")
+        else:
+            stream.write(json.dumps({"id": record_id, "path": path, "score": score}) + "\n")
+    else:
+        csv.writer(stream).writerow([record_id, "" if path is None else " ".join(str(state) for state in path),
+                                     "" if score is None else score, "" if error is None else error])
+
+# Per process state of the pool workers
+_worker = dict()
+
+def _init_worker(model_path):
+    _worker["model"] = cached_load_model(model_path)
+
+def _decode_chunk(chunk):
+    return decode_chunk(_worker["model"], chunk)
+
+def decode_chunk(model, chunk):
+    """Decodes (id, observations) records as one batch
+
+    Falls back to one record at a time when the batch fails, so a bad
+    record only fails itself.
+
+    Returns:
+        results (list): (id, path, score, error) per record
+
+    """
+    try:
+        paths, scores = model.decode_batch([observations for _, observations in chunk])
+        return [(record_id, _to_list(path), float(score), None) for (record_id, _), path, score in zip(chunk, paths, scores)]
+    except (KeyError, ValueError, IndexError, TypeError):
+        pass
+
+    results = []
+    for record_id, observations in chunk:
+        try:
+            path, score = model.decode(observations)
+            results.append((record_id, _to_list(path), float(score), None))
+        except (KeyError, ValueError, IndexError, TypeError) as error:
+            results.append((record_id, None, None, f"{type(error).__name__}: {error}"))
+    return results
+
+def _to_list(path):
+    return path.tolist() if isinstance(path, np.ndarray) else list(path)
+
+def _input_format(path, default):
+    if default is not None:
+        return default
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decodes observation records with a saved model (see model_io.py)")
+    parser.add_argument("model", help="Model file written by model_io.save_model")
+    parser.add_argument("inputs", nargs="*", default=["-"], help="JSONL or CSV files, - for stdin (default)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Input format, by default from the file extension")
+    parser.add_argument("--field", default="observations", help="Record field holding the observations")
+    parser.add_argument("--output", default="-", help="Output file, - for stdout (default)")
+    parser.add_argument("--output-format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--workers", type=int, help="Worker processes, defaults to the cpu count")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Sequences decoded together per task")
+    parser.add_argument("--max-in-flight", type=int, help="Chunks queued at once, defaults to two per worker")
+    args = parser.parse_args(argv)
+
+    def records():
+        first_id = 0
+        for path in args.inputs:
+            stream = sys.stdin if path == "-" else open(path, newline="")
+            try:
+                for record in read_records(stream, _input_format(path, args.format), args.field, first_id):
+                    first_id += 1
+                    yield record
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+
+    num_sequences = 0
+    num_observations = 0
+    num_errors = 0
+    start = time.perf_counter()
+    try:
+        for result in decode_records(args.model, records(),
+                                     workers=args.workers,
+                                     chunk_size=args.chunk_size,
+                                     max_in_flight=args.max_in_flight):
+            write_result(output, result, args.output_format)
+            num_sequences += 1
+            if result[3] is not None:
+                num_errors += 1
+            else:
+                num_observations += len(result[1])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    seconds = time.perf_counter() - start
+    print(f"Decoded {num_sequences} sequences ({num_observations} observations, {num_errors} errors) in {seconds:.3f} s: "
+          f"{num_sequences / max(seconds, 1e-9):.0f} sequences/s, {num_observations / max(seconds, 1e-9):.0f} observations/s",
+          file=sys.stderr)
+
+    return 1 if num_errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
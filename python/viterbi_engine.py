@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (c) 2020 Grant Hadlich
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import numpy as np
+import sparse_transitions
+
+# Number of steps gathered at a time by the blocked passes
+BLOCK_SIZE = 4096
+
+# Most elements of the (N x N x destinations) temporary built by transfer_matrix
+TRANSFER_BLOCK_ELEMENTS = 1 << 22
+
+
+def forward_pass(transition_matrix, emission_columns, column, use_log_probabilities, backtrack=None, scores=None, product=None, scale=None):
+    """Runs the Viterbi recursion over a block of pre-gathered emission columns
+
+    Every timestep is a single (N x N) broadcast of the previous column against
+    the transition matrix followed by one argmax over the previous states.
+
+    Args:
+        transition_matrix (nxn ndarray or SparseTransitions): Transition matrix (log or linear)
+        emission_columns (txn ndarray): Emission probability of the observation at each step
+        column (1xn ndarray): Accumulated probability of the step before emission_columns[0]
+        use_log_probabilities (bool): Add scores instead of multiplying them
+        backtrack (txn ndarray): Optional output for the best previous state of each step
+        scores (txn ndarray): Optional output for the accumulated probability of each step
+        product (nxn ndarray): Optional scratch buffer for the per step broadcast
+        scale (1x1 float64 ndarray): When given, every column is rescaled to a max of one
+            (zero in log space) and the log of the factor removed is added to scale[0]
+
+    Returns:
+        column (1xn ndarray): Accumulated probability of the last step
+
+    """
+    if isinstance(transition_matrix, sparse_transitions.SparseTransitions):
+        return sparse_transitions.sparse_forward_pass(transition_matrix, emission_columns, column,
+                                                      use_log_probabilities,
+                                                      backtrack=backtrack,
+                                                      scores=scores,
+                                                      scale=scale)
+
+    num_states = len(column)
+    combine = np.add if use_log_probabilities else np.multiply
+
+    # Scratch Space reused across every step
+    if product is None:
+        product = np.empty((num_states, num_states), dtype=np.result_type(transition_matrix, column))
+    state_index = np.arange(num_states)
+
+    for i in range(len(emission_columns)):
+        # Score every (previous, next) pair at once
+        combine(transition_matrix, column[:, None], out=product)
+
+        # Best previous state for each next state
+        best = product.argmax(axis=0)
+        column = combine(product[best, state_index], emission_columns[i])
+
+        if scale is not None:
+            rescale(column, use_log_probabilities, scale)
+
+        if backtrack is not None:
+            backtrack[i] = best
+
+        if scores is not None:
+            scores[i] = column
+
+    return column
+
+def rescale(column, use_log_probabilities, scale):
+    """Rescales column in place to a max of one (zero in log space), adding the log factor to scale[0]
+
+    Keeps reduced precision scores near zero, where they have the most resolution.
+    """
+    peak = column.max()
+    if use_log_probabilities and peak > -np.inf:
+        column -= peak
+        scale[0] += peak
+    elif not use_log_probabilities and peak > 0:
+        column /= peak
+        scale[0] += np.log(peak)
+
+def backtrack_path(backtrack, last_state, path=None):
+    """Follows the backtrack matrix from the final state to the first
+
+    Args:
+        backtrack (txn ndarray): Best previous state of each step, as filled by forward_pass
+        last_state (int): State of the final step
+        path (1x(t+1) ndarray): Optional output for the state sequence
+
+    Returns:
+        path (1x(t+1) ndarray): The most likely state sequence
+
+    """
+    if path is None:
+        path = np.zeros(len(backtrack) + 1, dtype=int)
+
+    path[-1] = last_state
+    state = int(last_state)
+    for i in range(len(backtrack) - 1, -1, -1):
+        state = int(backtrack[i, state])
+        path[i] = state
+
+    return path
+
+def backtrack_dtype(num_states):
+    """Smallest unsigned integer type able to hold every state index"""
+    return np.min_scalar_type(max(num_states - 1, 0))
+
+def blocked_forward_pass(transition_matrix, emission_rows, observations, column, use_log_probabilities, interval, backtrack=None, checkpoints=None, product=None, scale=None):
+    """Runs the recursion over observations[1:] gathering emissions one block at a time
+
+    Args:
+        transition_matrix (nxn ndarray): Transition matrix (log or linear)
+        emission_rows (oxn ndarray): Transposed emission matrix, one row per observation
+        observations (1xt ndarray): Index coded observations
+        column (1xn ndarray): Accumulated probability of the first observation
+        use_log_probabilities (bool): Add scores instead of multiplying them
+        interval (int): Number of steps per block
+        backtrack ((t-1)xn ndarray): Optional output for the best previous state of each step
+        checkpoints (cxn ndarray): Optional output for the column at steps 0, interval, 2*interval, ...
+        scale (1x1 float64 ndarray): Optional rescaling accumulator, see forward_pass
+
+    Returns:
+        column (1xn ndarray): Accumulated probability of the last step
+
+    """
+    num_steps = len(observations) - 1
+
+    for c, start in enumerate(range(0, num_steps, interval)):
+        stop = min(start + interval, num_steps)
+
+        if checkpoints is not None:
+            checkpoints[c] = column
+
+        column = forward_pass(transition_matrix, emission_rows[observations[start+1:stop+1]], column,
+                              use_log_probabilities,
+                              backtrack=None if backtrack is None else backtrack[start:stop],
+                              product=product,
+                              scale=scale)
+
+    return column
+
+def checkpointed_backtrack(transition_matrix, emission_rows, observations, checkpoints, interval, last_state, use_log_probabilities, path=None, product=None, scale=None):
+    """Backtracks by recomputing one segment of backpointers per checkpoint, last segment first
+
+    Args:
+        checkpoints (cxn ndarray): Columns saved by blocked_forward_pass
+        interval (int): Number of steps between checkpoints
+        last_state (int): State of the final step
+        scale (1x1 ndarray): Pass one if the forward pass rescaled, so segments are recomputed identically
+
+    Returns:
+        path (1xt ndarray): The most likely state sequence
+
+    """
+    num_steps = len(observations) - 1
+
+    if path is None:
+        path = np.zeros(num_steps + 1, dtype=int)
+
+    path[-1] = last_state
+    state = int(last_state)
+    segment = np.empty((min(interval, num_steps), transition_matrix.shape[0]),
+                       dtype=backtrack_dtype(transition_matrix.shape[0]))
+
+    for c in range(len(checkpoints) - 1, -1, -1):
+        start = c * interval
+        stop = min(start + interval, num_steps)
+
+        forward_pass(transition_matrix, emission_rows[observations[start+1:stop+1]], checkpoints[c],
+                     use_log_probabilities,
+                     backtrack=segment[:stop-start],
+                     product=product,
+                     scale=None if scale is None else np.zeros(1))
+
+        for i in range(stop - start - 1, -1, -1):
+            state = int(segment[i, state])
+            path[start + i] = state
+
+    return path
+
+def transfer_matrix(transition_matrix, emission_columns, use_log_probabilities, scale=None):
+    """Best score from every state before a block of steps to every state at its last step
+
+    Entry [i, j] is the max over paths entering the block from state i and
+    ending in state j, including the transitions and emissions of the block.
+    Each step costs N times a forward_pass step. The broadcast is done a few
+    destination states at a time, so the temporary stays under
+    TRANSFER_BLOCK_ELEMENTS elements instead of N x N x N.
+
+    When scale is given, the whole matrix is rescaled every step like a
+    forward_pass column and the log of the factor removed is added to scale[0].
+    """
+    if isinstance(transition_matrix, sparse_transitions.SparseTransitions):
+        transition_matrix = transition_matrix.to_dense()
+
+    combine = np.add if use_log_probabilities else np.multiply
+    num_states = transition_matrix.shape[0]
+    width = max(1, TRANSFER_BLOCK_ELEMENTS // (num_states * num_states))
+
+    transfer = combine(transition_matrix, emission_columns[0][None, :])
+    if scale is not None:
+        rescale(transfer, use_log_probabilities, scale)
+
+    following = np.empty_like(transfer)
+    for i in range(1, len(emission_columns)):
+        for start in range(0, num_states, width):
+            stop = min(start + width, num_states)
+            following[:, start:stop] = combine(transfer[:, :, None], transition_matrix[None, :, start:stop]).max(axis=1)
+
+        combine(following, emission_columns[i], out=following)
+        if scale is not None:
+            rescale(following, use_log_probabilities, scale)
+        transfer, following = following, transfer
+
+    return transfer